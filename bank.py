@@ -0,0 +1,179 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import time
+from multiprocessing import Pool
+from generator import generate_puzzle, check_target, Puzzle, GenerationError, DIFFICULTIES
+from grid import GRID_SIZE
+from protocol import pack_board, unpack_board, board_bytes
+
+MAGIC = b'SDKB'
+VERSION = 2
+HEADER = struct.Struct('!4sHH8x')
+BOARD_BYTES = board_bytes(GRID_SIZE)
+RECORD = struct.Struct(f'!{BOARD_BYTES}s{BOARD_BYTES}sBQBB')
+ANY_DIFFICULTY = 255
+ANY_CLUES = 255
+SAMPLE_ATTEMPTS = 64
+
+
+class BankError(ValueError):
+    pass
+
+
+def difficulty_code(difficulty):
+    return ANY_DIFFICULTY if difficulty is None else DIFFICULTIES.index(difficulty)
+
+
+def difficulty_name(code):
+    return None if code == ANY_DIFFICULTY else DIFFICULTIES[code]
+
+
+def encode_record(puzzle):
+    clue_target = ANY_CLUES if puzzle.clue_target is None else puzzle.clue_target
+    return RECORD.pack(pack_board(puzzle.board), pack_board(puzzle.solution), difficulty_code(puzzle.difficulty),
+                       puzzle.seed or 0, difficulty_code(puzzle.tier), clue_target)
+
+
+def decode_record(data):
+    board, solution, difficulty, seed, tier, clue_target = RECORD.unpack(data)
+    return Puzzle(unpack_board(board), unpack_board(solution), difficulty_name(difficulty),
+                  seed=seed or None, tier=difficulty_name(tier),
+                  clue_target=None if clue_target == ANY_CLUES else clue_target)
+
+
+class PuzzleBank:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise BankError(f"{path} is empty") from None
+        magic, version, record_size = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.close()
+            raise BankError(f"{path} is not a version {VERSION} puzzle bank")
+        self.count = (len(self.data) - HEADER.size) // RECORD.size
+
+    def __len__(self):
+        return self.count
+
+    def puzzle(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        offset = HEADER.size + index * RECORD.size
+        return decode_record(self.data[offset:offset + RECORD.size])
+
+    def sample(self, difficulty=None, rng=random):
+        if not self.count:
+            return None
+        for _ in range(SAMPLE_ATTEMPTS):
+            puzzle = self.puzzle(rng.randrange(self.count))
+            if difficulty is None or puzzle.difficulty == difficulty:
+                return puzzle
+        return None
+
+    def close(self):
+        if getattr(self, 'data', None) is not None:
+            self.data.close()
+        self.file.close()
+
+
+def generate_seeded(job):
+    seed, difficulty, clues = job
+    try:
+        return encode_record(generate_puzzle(difficulty, clues, seed=seed))
+    except GenerationError:
+        return None
+
+
+def build(path, count, difficulty=None, clues=None, workers=None, chunk_size=64):
+    check_target(difficulty, clues)
+    new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+    if not new_file:
+        PuzzleBank(path).close()
+
+    seeds = random.SystemRandom()
+    jobs = ((seeds.getrandbits(64), difficulty, clues) for _ in range(count))
+    start = time.perf_counter()
+    written = 0
+    with open(path, 'ab') as bank, Pool(workers) as pool:
+        if new_file:
+            bank.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        for record in pool.imap_unordered(generate_seeded, jobs, chunksize=chunk_size):
+            if record is None:
+                continue
+            bank.write(record)
+            written += 1
+            if written % 10000 == 0:
+                print(f"{written}/{count} puzzles ({written / (time.perf_counter() - start):.0f}/s)")
+    return written, time.perf_counter() - start
+
+
+def check(path, chunk_size=65536):
+    try:
+        import batch
+    except ImportError:
+        raise BankError("Checking a bank needs numpy") from None
+    bank = PuzzleBank(path)
+    invalid = inconsistent = 0
+    start = time.perf_counter()
+    try:
+        for first in range(0, len(bank), chunk_size):
+            count = min(chunk_size, len(bank) - first)
+            offset = HEADER.size + first * RECORD.size
+            rows = batch.records(bank.data[offset:offset + count * RECORD.size], RECORD.size)
+            boards = batch.unpack_boards(rows[:, :BOARD_BYTES])
+            solutions = batch.unpack_boards(rows[:, BOARD_BYTES:2 * BOARD_BYTES])
+            invalid += int((~batch.validate(solutions, complete=True)).sum())
+            inconsistent += int((~batch.consistent(boards, solutions)).sum())
+    finally:
+        bank.close()
+    return len(bank), invalid, inconsistent, time.perf_counter() - start
+
+
+def info(path):
+    bank = PuzzleBank(path)
+    tiers = {}
+    for index in range(len(bank)):
+        tier = bank.puzzle(index).difficulty
+        tiers[tier] = tiers.get(tier, 0) + 1
+    bank.close()
+    return tiers
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build and inspect on-disk puzzle banks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='create a bank or append puzzles to it')
+    build_parser.add_argument('path')
+    build_parser.add_argument('--count', type=int, default=10000)
+    build_parser.add_argument('--difficulty', choices=DIFFICULTIES)
+    build_parser.add_argument('--clues', type=int)
+    build_parser.add_argument('--workers', type=int, default=os.cpu_count())
+
+    info_parser = commands.add_parser('info', help='count the puzzles in a bank per difficulty tier')
+    info_parser.add_argument('path')
+
+    check_parser = commands.add_parser('check', help='validate every solution and given in a bank (needs numpy)')
+    check_parser.add_argument('path')
+
+    args = parser.parse_args()
+    if args.command == 'check':
+        total, invalid, inconsistent, elapsed = check(args.path)
+        print(f"Checked {total} puzzles in {elapsed:.2f}s: {invalid} invalid solutions, "
+              f"{inconsistent} givens that disagree with their solution")
+    elif args.command == 'build':
+        try:
+            written, elapsed = build(args.path, args.count, args.difficulty, args.clues, args.workers)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Wrote {written} puzzles to {args.path} in {elapsed:.1f}s")
+    else:
+        for tier, count in info(args.path).items():
+            print(f"{tier or 'any'}: {count}")
@@ -0,0 +1,85 @@
+from math import isqrt
+import numpy as np
+from grid import SUB_GRID_SIZE
+
+
+def pattern_table(sub_grid=SUB_GRID_SIZE):
+    size = sub_grid * sub_grid
+    rows, cols = np.indices((size, size))
+    return (sub_grid * (rows % sub_grid) + rows // sub_grid + cols) % size
+
+
+def permutations(rng, count, length):
+    return np.argsort(rng.random((count, length)), axis=1)
+
+
+def shuffled_lines(rng, count, sub_grid):
+    groups = permutations(rng, count, sub_grid)
+    within = permutations(rng, count * sub_grid, sub_grid).reshape(count, sub_grid, sub_grid)
+    return (groups[:, :, None] * sub_grid + within).reshape(count, -1)
+
+
+def create_grids(count, sub_grid=SUB_GRID_SIZE, rng=None):
+    rng = np.random.default_rng(rng)
+    size = sub_grid * sub_grid
+    rows = shuffled_lines(rng, count, sub_grid)
+    cols = shuffled_lines(rng, count, sub_grid)
+    nums = (permutations(rng, count, size) + 1).astype(np.uint8)
+    index = pattern_table(sub_grid)[rows[:, :, None], cols[:, None, :]]
+    return np.take_along_axis(nums, index.reshape(count, -1), axis=1).reshape(count, size, size)
+
+
+def unit_layout(size):
+    box = isqrt(size)
+    rows, cols = np.indices((size, size))
+    return rows.ravel(), cols.ravel(), ((rows // box) * box + cols // box).ravel()
+
+
+def validate(boards, complete=False):
+    boards = np.asarray(boards)
+    count, size, _ = boards.shape
+    values = boards.reshape(count, -1).astype(np.intp)
+    ok = (values <= size).all(axis=1)
+    if complete:
+        ok &= (values > 0).all(axis=1)
+    filled = (values > 0) & (values <= size)
+    offsets = np.arange(count)[:, None] * (size * size)
+    for unit in unit_layout(size):
+        keys = (offsets + unit * size + values - 1)[filled]
+        counts = np.bincount(keys, minlength=count * size * size)
+        ok &= (counts.reshape(count, -1) <= 1).all(axis=1)
+    return ok
+
+
+def consistent(boards, solutions):
+    boards, solutions = np.asarray(boards), np.asarray(solutions)
+    return ((boards == 0) | (boards == solutions)).all(axis=(1, 2))
+
+
+def random_masks(count, clues, size=SUB_GRID_SIZE * SUB_GRID_SIZE, rng=None):
+    rng = np.random.default_rng(rng)
+    keep = np.zeros((count, size * size), dtype=bool)
+    keep[:, :clues] = True
+    return rng.permuted(keep, axis=1).reshape(count, size, size)
+
+
+def apply_masks(boards, masks):
+    return np.where(masks, boards, 0).astype(np.uint8)
+
+
+def pack_boards(boards):
+    count = len(boards)
+    cells = np.asarray(boards, dtype=np.uint8).reshape(count, -1)
+    if cells.shape[1] % 2:
+        cells = np.concatenate([cells, np.zeros((count, 1), np.uint8)], axis=1)
+    return cells[:, 0::2] << 4 | cells[:, 1::2]
+
+
+def unpack_boards(packed, size=SUB_GRID_SIZE * SUB_GRID_SIZE):
+    packed = np.asarray(packed, dtype=np.uint8)
+    cells = np.stack([packed >> 4, packed & 0x0F], axis=2).reshape(len(packed), -1)
+    return cells[:, :size * size].reshape(len(packed), size, size)
+
+
+def records(data, record_size):
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, record_size)
@@ -0,0 +1,268 @@
+import argparse
+import pickle
+import random
+import select
+import socket
+import time
+import timeit
+import protocol
+from generator import generate_puzzle, DIFFICULTIES, SUB_GRID_SIZES
+from reliable import ReliableEndpoint, LossySocket
+from grid import create_grid, SUB_GRID_SIZE, solve, count_solutions, has_unique_solution, Grid
+try:
+    import batch
+except ImportError:
+    batch = None
+
+
+def sample_messages():
+    board = create_grid(SUB_GRID_SIZE)
+    for x, y in [(1, 1), (4, 2), (7, 5), (0, 8)]:
+        board[y][x] = 0
+    correct_cells = {(x, y) for y in range(9) for x in range(9) if (x + y) % 3 == 0}
+    state = {
+        'seq': 17,
+        'board': board,
+        'current_turn': 1,
+        'scores': {0: 12, 1: -3},
+        'correct_cells': correct_cells
+    }
+    return [
+        {'type': 'join', 'match_id': 42},
+        dict(state, type='init', match_id=42, player_number=0),
+        {'type': 'move', 'x': 4, 'y': 2, 'value': 7},
+        dict(state, type='update'),
+        dict(state, type='incorrect', incorrect_move={'x': 1, 'y': 1, 'value': 5}),
+        dict(state, type='game_end'),
+        {'type': 'delta', 'seq': 18, 'result': 'correct', 'player': 1, 'x': 4, 'y': 2, 'value': 7,
+         'current_turn': 0},
+        {'type': 'sync'},
+        {'type': 'ping'},
+        {'type': 'disconnect'},
+    ]
+
+
+def bench_protocol(args):
+    codecs = [
+        ('pickle', pickle.dumps, pickle.loads),
+        ('binary', protocol.encode, protocol.decode),
+    ]
+    print(f"{'type':<11}{'codec':<8}{'bytes':>7}{'encode/s':>12}{'decode/s':>12}")
+    for message in sample_messages():
+        for name, dumps, loads in codecs:
+            data = dumps(message)
+            decoded = loads(data)
+            assert decoded['type'] == message['type']
+            encode_time = timeit.timeit(lambda: dumps(message), number=args.iterations)
+            decode_time = timeit.timeit(lambda: loads(data), number=args.iterations)
+            print(f"{message['type']:<11}{name:<8}{len(data):>7}"
+                  f"{args.iterations / encode_time:>12.0f}{args.iterations / decode_time:>12.0f}")
+
+
+def bench_reliability(args):
+    sockets = []
+    for _ in range(2):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        sockets.append(sock)
+    sender_socket = LossySocket(sockets[0], loss=args.loss, seed=1)
+    receiver_socket = LossySocket(sockets[1], loss=args.loss, seed=2)
+    sender = ReliableEndpoint(sender_socket.sendto)
+    receiver = ReliableEndpoint(receiver_socket.sendto)
+    sender_addr, receiver_addr = sockets[0].getsockname(), sockets[1].getsockname()
+
+    payload = bytes(args.size)
+    delivered = 0
+    start = time.perf_counter()
+    for index in range(args.messages):
+        sender.send(index.to_bytes(4, 'big') + payload, receiver_addr)
+    while delivered < args.messages and time.perf_counter() - start < args.timeout:
+        delay = sender.next_delay(0.05)
+        readable, _, _ = select.select(sockets, [], [], delay)
+        for sock in readable:
+            data, addr = sock.recvfrom(65535)
+            if sock is sockets[1]:
+                for message in receiver.receive(data, addr):
+                    assert int.from_bytes(message[:4], 'big') == delivered
+                    delivered += 1
+            else:
+                sender.receive(data, addr)
+        sender.poll()
+    elapsed = time.perf_counter() - start
+
+    stats = sender.peer_stats(receiver_addr)
+    print(f"delivered {delivered}/{args.messages} in order in {elapsed:.2f}s "
+          f"({delivered / elapsed:.0f} msg/s, {args.loss:.0%} simulated loss each way)")
+    print(f"rtt {stats['rtt'] * 1000:.2f} ms, rto {stats['rto'] * 1000:.0f} ms, "
+          f"sent {stats['sent']}, retransmits {stats['retransmits']}, lost {stats['lost']}, "
+          f"dropped {sender_socket.dropped + receiver_socket.dropped}")
+    for sock in sockets:
+        sock.close()
+
+
+def dig_unique(board, rng):
+    puzzle = [row[:] for row in board]
+    for index in rng.sample(range(81), 81):
+        x, y = index % 9, index // 9
+        value, puzzle[y][x] = puzzle[y][x], 0
+        if count_solutions(puzzle, 2) != 1:
+            puzzle[y][x] = value
+    return puzzle
+
+
+def bench_solver(args):
+    rng = random.Random(args.seed)
+    puzzles = [dig_unique(create_grid(SUB_GRID_SIZE), rng) for _ in range(args.puzzles)]
+    clues = sum(1 for puzzle in puzzles for row in puzzle for value in row if value) / len(puzzles)
+    print(f"{len(puzzles)} minimal puzzles, {clues:.1f} clues on average")
+
+    start = time.perf_counter()
+    for puzzle in puzzles:
+        assert solve(puzzle) is not None
+    print(f"solve:               {len(puzzles) / (time.perf_counter() - start):8.0f} puzzles/s")
+
+    start = time.perf_counter()
+    for puzzle in puzzles:
+        assert has_unique_solution(puzzle)
+    print(f"has_unique_solution: {len(puzzles) / (time.perf_counter() - start):8.0f} puzzles/s")
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench_generator(args):
+    tiers = [args.difficulty] if args.difficulty else DIFFICULTIES
+    for difficulty in tiers:
+        puzzles = [generate_puzzle(difficulty, args.clues) for _ in range(args.puzzles)]
+        latencies = [puzzle.elapsed * 1000 for puzzle in puzzles]
+        clues = sum(puzzle.clues for puzzle in puzzles) / len(puzzles)
+        print(f"{difficulty:<7} {clues:5.1f} clues  p50 {percentile(latencies, 0.5):7.1f} ms  "
+              f"p99 {percentile(latencies, 0.99):7.1f} ms  max {max(latencies):7.1f} ms")
+
+
+def bench_seeds(args):
+    rng = random.Random(args.seed)
+    tiers = [args.difficulty] if args.difficulty else DIFFICULTIES
+    print(f"{'tier':<8}{'init B':>7}{'start B':>8}{'decode init':>13}{'regen p50':>11}{'regen p99':>11}")
+    for difficulty in tiers:
+        puzzles = [generate_puzzle(difficulty, args.clues, seed=rng.getrandbits(64)) for _ in range(args.puzzles)]
+        decode_times = []
+        regen_times = []
+        for puzzle in puzzles:
+            init = protocol.encode({'type': 'init', 'match_id': 1, 'player_number': 0, 'seq': 0,
+                                    'board': puzzle.board, 'current_turn': 0, 'scores': {0: 0, 1: 0},
+                                    'correct_cells': set()})
+            start = protocol.encode({'type': 'start', 'match_id': 1, 'player_number': 0, 'current_turn': 0,
+                                     'seed': puzzle.seed, 'difficulty': puzzle.tier, 'clues': puzzle.clue_target,
+                                     'size': puzzle.size})
+            begin = time.perf_counter()
+            protocol.decode(init)
+            decode_times.append(time.perf_counter() - begin)
+            begin = time.perf_counter()
+            message = protocol.decode(start)
+            board = generate_puzzle(message['difficulty'], message['clues'], seed=message['seed']).board
+            regen_times.append(time.perf_counter() - begin)
+            assert board == puzzle.board
+        print(f"{difficulty:<8}{len(init):>7}{len(start):>8}{percentile(decode_times, 0.5) * 1e6:>10.1f} us"
+              f"{percentile(regen_times, 0.5) * 1000:>8.1f} ms{percentile(regen_times, 0.99) * 1000:>8.1f} ms")
+
+
+def bench_batch(args):
+    if batch is None:
+        raise SystemExit("the batch benchmark needs numpy")
+    count = args.boards
+
+    def rate(label, function, boards):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        print(f"{label:<24}{boards / elapsed * 60 / 1e6:10.2f} M boards/min")
+        return result
+
+    rate('create_grid (python)', lambda: [create_grid(SUB_GRID_SIZE) for _ in range(count // 10)], count // 10)
+    grids = rate('create_grids (batch)', lambda: batch.create_grids(count, rng=args.seed), count)
+    rate('validate (batch)', lambda: batch.validate(grids, complete=True), count)
+    masks = batch.random_masks(count, args.clues, rng=args.seed)
+    puzzles = rate('apply_masks (batch)', lambda: batch.apply_masks(grids, masks), count)
+    rate('consistent (batch)', lambda: batch.consistent(puzzles, grids), count)
+    packed = rate('pack_boards (batch)', lambda: batch.pack_boards(puzzles), count)
+    rate('unpack_boards (batch)', lambda: batch.unpack_boards(packed), count)
+    assert batch.validate(grids, complete=True).all() and batch.validate(puzzles).all()
+
+
+def bench_sizes(args):
+    rng = random.Random(args.seed)
+    print(f"{'board':<7}{'clues':>6}{'gen p50':>11}{'gen max':>11}{'state B':>9}{'move':>10}{'sync':>10}")
+    for sub_grid in SUB_GRID_SIZES:
+        puzzles = [generate_puzzle(sub_grid=sub_grid, seed=rng.getrandbits(64)) for _ in range(args.puzzles)]
+        latencies = [puzzle.elapsed * 1000 for puzzle in puzzles]
+        clues = sum(puzzle.clues for puzzle in puzzles) / len(puzzles)
+        puzzle = puzzles[0]
+        size = puzzle.size
+        moves = [(x, y, puzzle.solution[y][x]) for y in range(size) for x in range(size) if not puzzle.board[y][x]]
+        grid = Grid(puzzle.board, puzzle.solution)
+        start = time.perf_counter()
+        for seq, (x, y, value) in enumerate(moves, 1):
+            if grid.is_correct(x, y, value):
+                grid.set_cell(x, y, value)
+            grid.is_complete()
+            protocol.encode({'type': 'delta', 'seq': seq, 'result': 'correct', 'player': 0, 'x': x, 'y': y,
+                             'value': value, 'current_turn': 1})
+        move_time = (time.perf_counter() - start) / len(moves)
+        state = {'type': 'update', 'seq': 1, 'current_turn': 0, 'scores': {0: 0, 1: 0}, 'board': puzzle.board,
+                 'correct_cells': {(x, y) for x, y, _ in moves[::2]}}
+        data = protocol.encode(state)
+        sync_time = timeit.timeit(lambda: protocol.decode(protocol.encode(state)), number=200) / 200
+        print(f"{size}x{size:<4}{clues:>6.0f}{percentile(latencies, 0.5):>8.1f} ms{max(latencies):>8.1f} ms"
+              f"{len(data):>9}{move_time * 1e6:>7.1f} us{sync_time * 1e6:>7.1f} us")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sudoku micro-benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    protocol_parser = commands.add_parser('protocol', help='compare the binary codec with pickle')
+    protocol_parser.add_argument('--iterations', type=int, default=20000)
+    protocol_parser.set_defaults(func=bench_protocol)
+
+    reliability_parser = commands.add_parser('reliability',
+                                             help='push messages through the reliable layer over a lossy socket')
+    reliability_parser.add_argument('--messages', type=int, default=2000)
+    reliability_parser.add_argument('--size', type=int, default=3000)
+    reliability_parser.add_argument('--loss', type=float, default=0.1)
+    reliability_parser.add_argument('--timeout', type=float, default=30.0)
+    reliability_parser.set_defaults(func=bench_reliability)
+
+    solver_parser = commands.add_parser('solver', help='solve and uniqueness-check minimal puzzles')
+    solver_parser.add_argument('--puzzles', type=int, default=200)
+    solver_parser.add_argument('--seed', type=int, default=1)
+    solver_parser.set_defaults(func=bench_solver)
+
+    generator_parser = commands.add_parser('generator', help='puzzle generation latency per difficulty tier')
+    generator_parser.add_argument('--puzzles', type=int, default=50)
+    generator_parser.add_argument('--difficulty', choices=DIFFICULTIES)
+    generator_parser.add_argument('--clues', type=int)
+    generator_parser.set_defaults(func=bench_generator)
+
+    seeds_parser = commands.add_parser('seeds', help='start a game from a seed versus sending the board')
+    seeds_parser.add_argument('--puzzles', type=int, default=50)
+    seeds_parser.add_argument('--difficulty', choices=DIFFICULTIES)
+    seeds_parser.add_argument('--clues', type=int)
+    seeds_parser.add_argument('--seed', type=int, default=1)
+    seeds_parser.set_defaults(func=bench_seeds)
+
+    sizes_parser = commands.add_parser('sizes', help='generation, wire size and per-move cost for 9x9 to 25x25')
+    sizes_parser.add_argument('--puzzles', type=int, default=10)
+    sizes_parser.add_argument('--seed', type=int, default=1)
+    sizes_parser.set_defaults(func=bench_sizes)
+
+    batch_parser = commands.add_parser('batch', help='NumPy batch generation, validation and masking rates')
+    batch_parser.add_argument('--boards', type=int, default=100000)
+    batch_parser.add_argument('--clues', type=int, default=30)
+    batch_parser.add_argument('--seed', type=int, default=1)
+    batch_parser.set_defaults(func=bench_batch)
+
+    args = parser.parse_args()
+    args.func(args)
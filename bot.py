@@ -0,0 +1,364 @@
+import argparse
+import heapq
+import random
+import selectors
+import socket
+import struct
+import time
+from itertools import count
+from multiprocessing import Pool
+import protocol
+from generator import generate_puzzle
+from grid import solve, GRID_SIZE
+from math import isqrt
+from reliable import ReliableEndpoint
+
+MAX_DATAGRAM = 65535
+JOIN_TIMEOUT = 2.0
+POLL_INTERVAL = 0.05
+RESPONSE_TIMEOUT = 5.0
+
+
+class HeadlessClient:
+    def __init__(self, server_addr, size=GRID_SIZE):
+        self.server_addr = server_addr
+        self.size = size
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.link = ReliableEndpoint(self.socket.sendto)
+        self.token = random.getrandbits(64) or 1
+        self.reset()
+
+    def reset(self):
+        self.board = None
+        self.puzzle = None
+        self.player_number = None
+        self.current_turn = None
+        self.scores = {0: 0, 1: 0}
+        self.seq = 0
+        self.match_id = None
+        self.joined = False
+        self.game_over = False
+
+    def send(self, message):
+        reliable = message['type'] in protocol.RELIABLE_TYPES
+        self.link.send(protocol.encode(message), self.server_addr, reliable)
+
+    def join(self, match_id=None):
+        self.reset()
+        self.link.forget(self.server_addr)
+        message = {'type': 'join', 'token': self.token, 'size': self.size}
+        if match_id is not None:
+            message['match_id'] = match_id
+        self.send(message)
+
+    def move(self, x, y, value):
+        self.send({'type': 'move', 'x': x, 'y': y, 'value': value})
+
+    def disconnect(self):
+        self.send({'type': 'disconnect'})
+        self.socket.close()
+
+    def receive_pending(self):
+        messages = []
+        while True:
+            try:
+                data, _ = self.socket.recvfrom(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError, ConnectionRefusedError):
+                return messages
+            try:
+                for payload in self.link.receive(data, self.server_addr):
+                    message = protocol.decode(payload)
+                    if message['type'] == 'start':
+                        self.puzzle = generate_puzzle(message['difficulty'], message['clues'],
+                                                      sub_grid=isqrt(message['size']), seed=message['seed'])
+                        message['board'] = [row[:] for row in self.puzzle.board]
+                    messages.append(message)
+            except (ValueError, struct.error):
+                continue
+
+    def apply(self, message):
+        kind = message['type']
+        if kind in ('init', 'start'):
+            self.joined = True
+            self.match_id = message['match_id']
+            self.player_number = message['player_number']
+            self.load_state(message)
+        elif kind == 'update':
+            self.load_state(message)
+        elif kind == 'game_end':
+            self.load_state(message)
+            self.game_over = True
+        elif kind == 'delta':
+            if message['seq'] > self.seq + 1:
+                self.send({'type': 'sync'})
+            elif message['seq'] == self.seq + 1:
+                self.seq = message['seq']
+                self.current_turn = message['current_turn']
+                if message['result'] == 'correct':
+                    self.board[message['y']][message['x']] = message['value']
+                    self.scores[message['player']] += 1
+                elif message['result'] == 'incorrect':
+                    self.scores[message['player']] -= 1
+        elif kind == 'ping':
+            self.send({'type': 'ping'})
+        elif kind == 'disconnect':
+            self.joined = False
+            self.game_over = True
+
+    def load_state(self, message):
+        self.board = message['board']
+        self.seq = message['seq']
+        self.current_turn = message.get('current_turn', self.current_turn)
+        self.scores = message['scores']
+
+    def my_turn(self):
+        return self.joined and not self.game_over and self.current_turn == self.player_number
+
+
+class Bot(HeadlessClient):
+    def __init__(self, server_addr, strategy='solver', move_rate=1.0, error_rate=0.0, rng=random, size=GRID_SIZE):
+        self.strategy = strategy
+        self.move_rate = move_rate
+        self.error_rate = error_rate
+        self.rng = rng
+        self.solution = None
+        self.in_flight = None
+        self.move_due = None
+        self.join_sent = 0.0
+        self.moves = 0
+        self.answered = 0
+        self.unanswered = 0
+        self.games = 0
+        self.latencies = []
+        super().__init__(server_addr, size)
+
+    def join(self, match_id=None):
+        super().join(match_id)
+        self.solution = None
+        self.in_flight = None
+        self.move_due = None
+        self.join_sent = time.perf_counter()
+
+    def apply(self, message):
+        super().apply(message)
+        kind = message['type']
+        if kind == 'start' and self.strategy == 'solver':
+            self.solution = self.puzzle.solution
+        elif kind == 'init' and self.strategy == 'solver':
+            self.solution = solve(self.board)
+        elif kind == 'update' and self.strategy == 'solver' and self.solution is None:
+            self.solution = solve(self.board)
+        elif kind in ('delta', 'game_end') and self.in_flight is not None:
+            if kind == 'game_end' or message['player'] == self.player_number:
+                self.latencies.append(time.perf_counter() - self.in_flight)
+                self.answered += 1
+                self.in_flight = None
+        if kind == 'game_end':
+            self.games += 1
+
+    def choose_move(self):
+        size = len(self.board)
+        empty = [(x, y) for y in range(size) for x in range(size) if not self.board[y][x]]
+        if not empty:
+            return None
+        x, y = self.rng.choice(empty)
+        if self.solution is None or self.rng.random() < self.error_rate:
+            return x, y, self.rng.randint(1, size)
+        return x, y, self.solution[y][x]
+
+    def next_move_delay(self):
+        return self.rng.expovariate(self.move_rate) if self.move_rate > 0 else 0.0
+
+    def play(self, now):
+        if not self.my_turn() or self.in_flight is not None:
+            return False
+        move = self.choose_move()
+        if move is None:
+            return False
+        self.move(*move)
+        self.in_flight = now
+        self.moves += 1
+        return True
+
+
+class Spectator(HeadlessClient):
+    def __init__(self, server_addr, match_id=None):
+        self.watch_id = match_id
+        self.join_sent = 0.0
+        self.updates = 0
+        super().__init__(server_addr)
+
+    def watch(self):
+        self.reset()
+        self.join_sent = time.perf_counter()
+        message = {'type': 'watch'}
+        if self.watch_id is not None:
+            message['match_id'] = self.watch_id
+        self.send(message)
+
+    def apply(self, message):
+        super().apply(message)
+        if message['type'] in ('delta', 'update', 'game_end'):
+            self.updates += 1
+
+
+def run_bots(job):
+    host, port, players, spectators, strategy, move_rate, error_rate, duration, ramp_up, seed, size = job
+    rng = random.Random(seed)
+    server_addr = (host, port)
+    bots = [Bot(server_addr, strategy, move_rate, error_rate, random.Random(rng.getrandbits(64)), size)
+            for _ in range(players)]
+    watchers = [Spectator(server_addr) for _ in range(spectators)]
+    selector = selectors.DefaultSelector()
+    for client in bots + watchers:
+        selector.register(client.socket, selectors.EVENT_READ, client)
+
+    start = time.perf_counter()
+    end = start + duration
+    schedule = []
+    sequence = count()
+
+    def schedule_action(bot, when, action):
+        heapq.heappush(schedule, (when, next(sequence), bot, action))
+
+    def schedule_move(bot, now):
+        if bot.my_turn() and bot.in_flight is None and bot.move_due is None:
+            bot.move_due = now + bot.next_move_delay()
+            schedule_action(bot, bot.move_due, 'move')
+
+    for index, bot in enumerate(bots):
+        schedule_action(bot, start + ramp_up * index / max(players, 1), 'join')
+    for watcher in watchers:
+        schedule_action(watcher, start + ramp_up + JOIN_TIMEOUT, 'watch')
+    next_poll = start
+
+    while True:
+        now = time.perf_counter()
+        if now >= end:
+            break
+        while schedule and schedule[0][0] <= now:
+            _, _, bot, action = heapq.heappop(schedule)
+            if action == 'join':
+                bot.join()
+            elif action == 'watch':
+                bot.watch()
+            else:
+                bot.move_due = None
+                bot.play(now)
+
+        if now >= next_poll:
+            next_poll = now + POLL_INTERVAL
+            for bot in bots:
+                if bot.link.poll() or (bot.join_sent and not bot.joined and now - bot.join_sent > JOIN_TIMEOUT):
+                    bot.join()
+                elif bot.in_flight is not None and now - bot.in_flight >= RESPONSE_TIMEOUT:
+                    bot.in_flight = None
+                    bot.unanswered += 1
+                    schedule_move(bot, now)
+            for watcher in watchers:
+                if watcher.join_sent and not watcher.joined and now - watcher.join_sent > JOIN_TIMEOUT:
+                    watcher.watch()
+
+        timeout = min(POLL_INTERVAL, max(0.0, (schedule[0][0] if schedule else end) - now))
+        for key, _ in selector.select(timeout):
+            bot = key.data
+            for message in bot.receive_pending():
+                bot.apply(message)
+            now = time.perf_counter()
+            if isinstance(bot, Spectator):
+                if bot.game_over:
+                    bot.reset()
+                    bot.join_sent = 0.0
+                    schedule_action(bot, now + JOIN_TIMEOUT / 4, 'watch')
+            elif bot.game_over:
+                bot.reset()
+                bot.join_sent = 0.0
+                schedule_action(bot, now + bot.next_move_delay(), 'join')
+            else:
+                schedule_move(bot, now)
+
+    retransmits = sent = 0
+    for bot in bots:
+        stats = bot.link.peer_stats(server_addr)
+        if stats is not None:
+            retransmits += stats['retransmits']
+            sent += stats['sent']
+        bot.unanswered += bot.in_flight is not None
+        bot.disconnect()
+    for watcher in watchers:
+        watcher.disconnect()
+    return {
+        'spectator_updates': sum(watcher.updates for watcher in watchers),
+        'moves': sum(bot.moves for bot in bots),
+        'answered': sum(bot.answered for bot in bots),
+        'unanswered': sum(bot.unanswered for bot in bots),
+        'games': sum(bot.games for bot in bots),
+        'latencies': [latency for bot in bots for latency in bot.latencies],
+        'sent': sent,
+        'retransmits': retransmits,
+        'elapsed': time.perf_counter() - start
+    }
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def split(total, parts):
+    return [total // parts + (index < total % parts) for index in range(parts)]
+
+
+def load_test(host, port, players, processes, strategy, move_rate, error_rate, duration, ramp_up, seed=None,
+              spectators=0, size=GRID_SIZE):
+    rng = random.Random(seed)
+    jobs = [(host, port, share, watchers, strategy, move_rate, error_rate, duration, ramp_up, rng.getrandbits(64),
+             size)
+            for share, watchers in zip(split(players, processes), split(spectators, processes))
+            if share or watchers]
+    with Pool(len(jobs)) as pool:
+        results = pool.map(run_bots, jobs)
+
+    totals = {key: sum(result[key] for result in results)
+              for key in ('moves', 'answered', 'unanswered', 'games', 'sent', 'retransmits', 'spectator_updates')}
+    latencies = [latency for result in results for latency in result['latencies']]
+    elapsed = max(result['elapsed'] for result in results)
+    totals['elapsed'] = elapsed
+    totals['throughput'] = totals['answered'] / elapsed if elapsed else 0.0
+    totals['p50'] = percentile(latencies, 0.5)
+    totals['p99'] = percentile(latencies, 0.99)
+    totals['loss'] = totals['unanswered'] / totals['moves'] if totals['moves'] else 0.0
+    totals['retransmit_rate'] = totals['retransmits'] / totals['sent'] if totals['sent'] else 0.0
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless Sudoku bots for load-testing the server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--players', type=int, default=100)
+    parser.add_argument('--spectators', type=int, default=0, help='clients watching running matches')
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--strategy', choices=['solver', 'random'], default='solver')
+    parser.add_argument('--move-rate', type=float, default=2.0, help='moves per second a bot makes on its turn')
+    parser.add_argument('--error-rate', type=float, default=0.1, help='share of deliberately wrong moves')
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--ramp-up', type=float, default=2.0, help='seconds over which bots join')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--size', type=int, choices=protocol.BOARD_SIZES, default=GRID_SIZE,
+                        help='board size to play')
+    args = parser.parse_args()
+
+    report = load_test(args.host, args.port, args.players, args.processes, args.strategy,
+                       args.move_rate, args.error_rate, args.duration, args.ramp_up, args.seed, args.spectators,
+                       args.size)
+    print(f"{args.players} bots over {args.processes} processes for {report['elapsed']:.1f}s")
+    print(f"moves: {report['moves']} sent, {report['answered']} answered "
+          f"({report['throughput']:.1f} moves/s), {report['games']} games finished")
+    print(f"move-to-update latency: p50 {report['p50'] * 1000:.2f} ms, p99 {report['p99'] * 1000:.2f} ms")
+    print(f"loss: {report['loss']:.2%} moves unanswered, {report['retransmit_rate']:.2%} packets retransmitted")
+    if args.spectators:
+        print(f"spectators: {args.spectators} received {report['spectator_updates']} updates")
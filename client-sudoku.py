@@ -1,11 +1,31 @@
 import pygame
 import os
+import argparse
+import random
 import socket
-import pickle
 from grid import Grid
+from network import ClientNetwork, NETWORK_EVENT, MAX_DATAGRAM
+from render import Renderer, GridView, BOARD_PIXELS
+from protocol import SPECTATOR, BOARD_SIZES
+
+IDLE_TIMEOUT = 100
+JOIN_TIMEOUT = 1.0
+JOIN_RETRIES = 5
+RESUME_RETRIES = 30
+
+def load_identity(path=None):
+    if path is not None and os.path.exists(path):
+        with open(path) as f:
+            return int(f.read().strip(), 16)
+    token = random.SystemRandom().getrandbits(64) or 1
+    if path is not None:
+        with open(path, 'w') as f:
+            f.write(f'{token:016x}\n')
+    return token
+
 
 class SudokuClient:
-    def __init__(self):
+    def __init__(self, token=None, spectate=False, size=None):
         self.window_width = 800
         self.window_height = 590
         self.cell_size = 60
@@ -19,6 +39,9 @@ class SudokuClient:
         pygame.font.init()
         self.game_font = pygame.font.SysFont('Arial', 32)
         self.score_font = pygame.font.SysFont('Arial', 24)
+        self.view = None
+        self.size = size
+        self.typed = ''
         
         self.num_x_offset = 22
         self.num_y_offset = 14
@@ -32,30 +55,63 @@ class SudokuClient:
         self.player_indicator_y = 20
         
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.network = ClientNetwork(self.socket)
         self.server_addr = None
         self.grid = None
         self.player_number = None
         self.current_turn = 0
         self.selected_cell = None
         self.scores = {0: 0, 1: 0}
+        self.match_id = None
+        self.seq = 0
+        self.token = token if token is not None else load_identity()
+        self.spectate = spectate
 
 
 
-    def connect(self, host='localhost', port=5555):
+    def connect(self, host='localhost', port=5555, match_id=None, retries=JOIN_RETRIES):
         try:
             self.server_addr = (host, port)
-            join_message = {'type': 'join'}
-            self.socket.sendto(pickle.dumps(join_message), self.server_addr)
-            
-            data, _ = self.socket.recvfrom(4096)
-            init_data = pickle.loads(data)
+            self.network.server_addr = self.server_addr
+            self.network.link.forget(self.server_addr)
+            if self.spectate:
+                join_message = {'type': 'watch'}
+            else:
+                join_message = {'type': 'join', 'token': self.token, 'size': self.size}
+            if match_id is not None:
+                join_message['match_id'] = match_id
+            init_data = None
+            self.socket.settimeout(JOIN_TIMEOUT)
+            for _ in range(retries):
+                self.send(join_message)
+                try:
+                    while init_data is None:
+                        data, _ = self.socket.recvfrom(MAX_DATAGRAM)
+                        for message in self.receive(data):
+                            if message['type'] in ('init', 'start'):
+                                init_data = message
+                    break
+                except (socket.timeout, ConnectionRefusedError):
+                    continue
+            if init_data is None:
+                raise ConnectionError("no response from server")
             
-            self.grid = Grid(self.game_font)
-            self.grid.grid = init_data['board']
+            self.grid = Grid(init_data['board'])
+            if self.view is None or self.view.size != self.grid.size:
+                cell_size = BOARD_PIXELS // self.grid.size
+                self.view = GridView(pygame.font.SysFont('Arial', cell_size // 2), self.grid.size)
             self.player_number = init_data['player_number']
+            self.grid.correct_cells = init_data['correct_cells']
             self.current_turn = init_data['current_turn']
+            self.scores = init_data['scores']
+            self.match_id = init_data.get('match_id')
+            self.seq = init_data['seq']
             
-            print(f"Connected as Player {self.player_number}")
+            if self.player_number == SPECTATOR:
+                print(f"Watching room {self.match_id}")
+            else:
+                print(f"Connected as Player {self.player_number} in room {self.match_id}")
+            self.selected_cell = None
             return True
         except Exception as e:
             print(f"Connection failed: {e}")
@@ -65,11 +121,27 @@ class SudokuClient:
         if self.current_turn != self.player_number or self.is_game_complete():
             return
             
-        x = pos[0] // self.grid.cell_size
-        y = pos[1] // self.grid.cell_size
-        if 0 <= x < 9 and 0 <= y < 9:
+        x, y = self.view.cell_at(pos)
+        if self.grid.contains(x, y):
             if self.grid.get_cell(x, y) == 0:
                 self.selected_cell = (x, y)
+                self.typed = ''
+
+    def handle_digit(self, digit):
+        typed = self.typed + digit
+        value = int(typed)
+        if value == 0 or value > self.grid.size:
+            self.typed = ''
+        elif value * 10 > self.grid.size:
+            self.typed = ''
+            self.handle_number_input(value)
+        else:
+            self.typed = typed
+
+    def commit_typed(self):
+        if self.typed:
+            value, self.typed = int(self.typed), ''
+            self.handle_number_input(value)
 
     def handle_number_input(self, number):
         if self.selected_cell and self.current_turn == self.player_number:
@@ -81,11 +153,28 @@ class SudokuClient:
                     'y': y,
                     'value': number
                 }
-                self.socket.sendto(pickle.dumps(move_data), self.server_addr)
+                self.send(move_data)
                 self.selected_cell = None
 
+    def send(self, message):
+        self.network.send(message)
+
+    def receive(self, data):
+        return self.network.receive(data)
+
+    def request_snapshot(self):
+        self.send({'type': 'sync'})
+
+    def resume(self):
+        print("Lost contact with server. Trying to resume...")
+        self.network.stop()
+        if not self.connect(self.server_addr[0], self.server_addr[1], self.match_id, RESUME_RETRIES):
+            return False
+        self.network.start()
+        return True
+
     def draw_player_indicator(self):
-        player_text = f"Player {self.player_number}"
+        player_text = "Spectating" if self.spectate else f"Player {self.player_number}"
         color = (0, 255, 0) if self.current_turn == self.player_number else (255, 255, 255)
         text_surface = self.game_font.render(player_text, False, color)
         self.surface.blit(text_surface, (self.player_indicator_x, self.player_indicator_y))
@@ -114,11 +203,7 @@ class SudokuClient:
             ))
 
     def is_game_complete(self):
-        for y in range(len(self.grid.grid)):
-            for x in range(len(self.grid.grid[y])):
-                if self.grid.get_cell(x, y) == 0:
-                    return False
-        return True
+        return self.grid.is_complete()
 
     def draw_game_result(self):
         if not hasattr(self, 'scores'):
@@ -146,88 +231,103 @@ class SudokuClient:
         pygame.draw.rect(self.surface, (50, 50, 50), bg_rect)
         
         self.surface.blit(text_surface, text_rect)
+        return bg_rect
 
 
-    def run(self):
+    def run(self, fps=60, show_stats=False):
+        renderer = Renderer(self, fps, show_stats)
         running = True
         incorrect_moves = {}
         game_ended = False
         end_time = None
         
+        self.network.start()
         while running:
-            for event in pygame.event.get():
+            events = [pygame.event.wait(IDLE_TIMEOUT)] + pygame.event.get()
+            for event in events:
+                if event.type == pygame.NOEVENT:
+                    continue
+                renderer.mark_changed()
                 if event.type == pygame.QUIT:
                     running = False
+                elif event.type == pygame.VIDEOEXPOSE:
+                    renderer.invalidate()
                 elif event.type == pygame.MOUSEBUTTONDOWN and not game_ended:
                     self.handle_click(event.pos)
                 elif event.type == pygame.KEYDOWN and not game_ended:
-                    if event.key in [pygame.K_1, pygame.K_2, pygame.K_3, 
-                                pygame.K_4, pygame.K_5, pygame.K_6, 
-                                pygame.K_7, pygame.K_8, pygame.K_9]:
-                        number = int(event.unicode)
-                        self.handle_number_input(number)
-
-            try:
-                self.socket.settimeout(0.001)
-                data, _ = self.socket.recvfrom(4096)
-                if data:
-                    update = pickle.loads(data)
+                    if event.unicode.isdecimal():
+                        self.handle_digit(event.unicode)
+                    elif event.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
+                        self.commit_typed()
+                elif event.type == NETWORK_EVENT:
+                    update = event.message
                     if update.get('type') == 'game_end':
                         game_ended = True
                         end_time = pygame.time.get_ticks()
-                        self.grid.grid = update['board']
+                        self.grid.load_board(update['board'])
                         self.scores = update['scores']
                         if 'correct_cells' in update:
                             self.grid.correct_cells = update['correct_cells']
                     elif update.get('type') == 'disconnect':
                         print("Server has disconnected. Exiting...")
                         running = False
+                    elif update.get('type') == 'lost':
+                        if self.resume():
+                            renderer.invalidate()
+                            incorrect_moves = {}
+                        else:
+                            print("Could not resume the game. Exiting...")
+                            running = False
+                    elif update.get('type') == 'delta':
+                        if update['seq'] > self.seq + 1:
+                            self.request_snapshot()
+                        elif update['seq'] == self.seq + 1:
+                            self.seq = update['seq']
+                            self.current_turn = update['current_turn']
+                            x, y, player = update['x'], update['y'], update['player']
+                            if update['result'] == 'correct':
+                                self.grid.set_cell(x, y, update['value'])
+                                self.grid.correct_cells.add((x, y))
+                                self.scores[player] += 1
+                            elif update['result'] == 'incorrect':
+                                self.scores[player] -= 1
+                            if update['result'] == 'incorrect' and player == self.player_number:
+                                incorrect_moves[(x, y)] = update['value']
+                            elif self.current_turn == self.player_number:
+                                incorrect_moves = {}
                     else:
-                        self.grid.grid = update['board']
+                        self.seq = update['seq']
+                        self.grid.load_board(update['board'])
                         self.current_turn = update['current_turn']
                         self.scores = update['scores']
-                        if 'correct_cells' in update:
-                            self.grid.correct_cells = update['correct_cells']
-                        if 'incorrect_move' in update:
-                            x, y = update['incorrect_move']['x'], update['incorrect_move']['y']
-                            incorrect_moves[(x, y)] = update['incorrect_move']['value']
-                        elif self.current_turn == self.player_number:
-                            incorrect_moves = {}
-            except socket.timeout:
-                pass
+                        self.grid.correct_cells = update['correct_cells']
 
-            self.surface.fill((0,0,0))
             if self.grid:
-                self.grid.draw_all(pygame, self.surface)
-                
-                for (x, y), value in incorrect_moves.items():
-                    text_surface = self.game_font.render(str(value), False, (255, 0, 0))
-                    self.surface.blit(text_surface, (x * self.grid.cell_size + self.num_x_offset, 
-                                                y * self.grid.cell_size + self.num_y_offset))
-                
-                if self.selected_cell and not game_ended:
-                    x, y = self.selected_cell
-                    rect = pygame.Rect(x * self.grid.cell_size, y * self.grid.cell_size, 
-                                    self.grid.cell_size, self.grid.cell_size)
-                    pygame.draw.rect(self.surface, (0, 255, 0), rect, 3)
-                
-                self.draw_score_table()
-                self.draw_player_indicator()
-                
-                if game_ended:
-                    self.draw_game_result()
-                    if pygame.time.get_ticks() - end_time > 5000:
-                        running = False
-                
-            pygame.display.flip()
+                renderer.render(incorrect_moves, game_ended)
+                if game_ended and pygame.time.get_ticks() - end_time > 5000:
+                    running = False
 
+        self.network.stop()
         disconnect_msg = {'type': 'disconnect'}
-        self.socket.sendto(pickle.dumps(disconnect_msg), self.server_addr)
+        self.send(disconnect_msg)
         self.socket.close()
+        print(f"Frames: {renderer.total.report()}")
     
 
 if __name__ == "__main__":
-    client = SudokuClient()
-    if client.connect():
-        client.run()
+    parser = argparse.ArgumentParser(description='Sudoku game client')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--match-id', type=int, help='join a specific room')
+    parser.add_argument('--fps', type=int, default=60, help='frame rate cap')
+    parser.add_argument('--stats', action='store_true', help='print frame time and CPU use periodically')
+    parser.add_argument('--watch', action='store_true', help='watch a match (--match-id, or any running one)')
+    parser.add_argument('--size', type=int, choices=BOARD_SIZES,
+                        help='board size for a new game (default: 9); joining a match uses its size')
+    parser.add_argument('--identity', help='file holding this player\'s identity, so a restarted client '
+                                           'can resume its game')
+    args = parser.parse_args()
+    client = SudokuClient(load_identity(args.identity), args.watch, args.size)
+    if client.connect(args.host, args.port, args.match_id):
+        client.run(args.fps, args.stats)
 
@@ -0,0 +1,107 @@
+import random
+import time
+from grid import create_grid, load_board, propagate, count_solutions, SUB_GRID_SIZE
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+MAX_ATTEMPTS = 20
+SUB_GRID_SIZES = (3, 4, 5)
+DEFAULT_CLUES = {4: 120, 5: 350}
+MAX_CLUES = {3: {'medium': 40, 'hard': 32}, 4: {'medium': 125, 'hard': 112}, 5: {'medium': 350, 'hard': 320}}
+
+
+class GenerationError(ValueError):
+    pass
+
+
+class Puzzle:
+    def __init__(self, board, solution, difficulty, elapsed=0.0, attempts=0, seed=None, tier=None, clue_target=None):
+        self.board = board
+        self.solution = solution
+        self.difficulty = difficulty
+        self.clues = sum(1 for row in board for value in row if value)
+        self.elapsed = elapsed
+        self.attempts = attempts
+        self.seed = seed
+        self.tier = tier
+        self.clue_target = clue_target
+
+    @property
+    def size(self):
+        return len(self.board)
+
+    @property
+    def key(self):
+        return None if self.seed is None else (self.seed, self.tier, self.clue_target)
+
+    def __repr__(self):
+        return (f"Puzzle({self.difficulty}, {self.clues} clues, "
+                f"{self.elapsed * 1000:.1f} ms, {self.attempts} attempts)")
+
+
+def rate(board):
+    state = load_board(board)
+    if state is None:
+        return None
+    steps = {'naked': 0, 'hidden': 0}
+    candidates = propagate(*state, steps=steps)
+    if candidates is None:
+        return None
+    if any(candidates):
+        return 'hard'
+    return 'medium' if steps['hidden'] else 'easy'
+
+
+def dig(solution, difficulty=None, clues=None, rng=random):
+    size = len(solution)
+    ceiling = DIFFICULTIES.index(difficulty) if difficulty else len(DIFFICULTIES) - 1
+    puzzle = [row[:] for row in solution]
+    remaining = size * size
+
+    for index in rng.sample(range(size * size), size * size):
+        if clues is not None and remaining <= clues:
+            break
+        x, y = index % size, index // size
+        value, puzzle[y][x] = puzzle[y][x], 0
+        if count_solutions(puzzle, 2) == 1 and DIFFICULTIES.index(rate(puzzle)) <= ceiling:
+            remaining -= 1
+        else:
+            puzzle[y][x] = value
+    return puzzle
+
+
+def check_target(difficulty=None, clues=None, sub_grid=SUB_GRID_SIZE):
+    if difficulty is not None and difficulty not in DIFFICULTIES:
+        raise ValueError(f"Unknown difficulty {difficulty!r}, expected one of {DIFFICULTIES}")
+    if sub_grid not in SUB_GRID_SIZES:
+        raise ValueError(f"Unsupported box size {sub_grid}, expected one of {SUB_GRID_SIZES}")
+    size = sub_grid * sub_grid
+    if clues is not None and not 0 <= clues <= size * size:
+        raise ValueError(f"Clue count out of range: {clues}")
+    limit = MAX_CLUES.get(sub_grid, {}).get(difficulty)
+    if clues is not None and limit is not None and clues > limit:
+        raise ValueError(f"{size}x{size} puzzles with {clues} clues are seldom or never {difficulty}; "
+                         f"use at most {limit} clues")
+
+
+def default_clues(difficulty=None, sub_grid=SUB_GRID_SIZE):
+    target = DEFAULT_CLUES.get(sub_grid)
+    limit = MAX_CLUES.get(sub_grid, {}).get(difficulty)
+    return target if target is None or limit is None else min(target, limit)
+
+
+def generate_puzzle(difficulty=None, clues=None, rng=random, sub_grid=SUB_GRID_SIZE, seed=None):
+    check_target(difficulty, clues, sub_grid)
+    target = default_clues(difficulty, sub_grid) if clues is None else clues
+
+    if seed is not None:
+        rng = random.Random(seed)
+    start = time.perf_counter()
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        solution = create_grid(sub_grid, rng)
+        board = dig(solution, difficulty, target, rng)
+        rating = rate(board)
+        if difficulty is None or rating == difficulty:
+            break
+    else:
+        raise GenerationError(f"No {difficulty} puzzle with {target} clues in {MAX_ATTEMPTS} attempts")
+    return Puzzle(board, solution, rating, time.perf_counter() - start, attempt, seed, difficulty, clues)
@@ -1,89 +1,302 @@
-from random import sample
-
-def create_line_coordinates(cell_size):
-    points=[]
-    for y in range(1,9):
-        temp=[]
-        temp.append((0, y*cell_size))
-        temp.append((585, y*cell_size))
-        points.append(temp)
-
-    for x in range(1,10):
-        temp=[]
-        temp.append((x*cell_size,0))
-        temp.append((x*cell_size,600))
-        points.append(temp)
-
-    # print(points)
-    return points
+import random
+from functools import lru_cache
+from math import isqrt
+from array import array
 
 SUB_GRID_SIZE=3
 GRID_SIZE=SUB_GRID_SIZE*SUB_GRID_SIZE
 
-def pattern(row_num, col_num):
-    return(SUB_GRID_SIZE * (row_num % SUB_GRID_SIZE)+row_num // SUB_GRID_SIZE + col_num) % GRID_SIZE
+def pattern(row_num, col_num, sub_grid=SUB_GRID_SIZE):
+    return(sub_grid * (row_num % sub_grid)+row_num // sub_grid + col_num) % (sub_grid * sub_grid)
 
-def shuffle(samp):
-    return sample(samp, len(samp))
+def shuffle(samp, rng=random):
+    return rng.sample(samp, len(samp))
 
-def create_grid(sub_grid):
+def create_grid(sub_grid, rng=random):
     row_base = range(sub_grid)
-    rows = [g*sub_grid+r for g in shuffle(row_base) for r in shuffle(row_base)]
-    cols = [g*sub_grid+c for g in shuffle(row_base) for c in shuffle(row_base)]
-    nums=shuffle(range(1, sub_grid*sub_grid+1))
-    return [[nums[pattern(r,c)]for c in cols]for r in rows]
+    rows = [g*sub_grid+r for g in shuffle(row_base, rng) for r in shuffle(row_base, rng)]
+    cols = [g*sub_grid+c for g in shuffle(row_base, rng) for c in shuffle(row_base, rng)]
+    nums=shuffle(range(1, sub_grid*sub_grid+1), rng)
+    return [[nums[pattern(r,c,sub_grid)]for c in cols]for r in rows]
 
 
-class Grid:
-    def __init__(self, font):
-        self.cell_size=65
-        self.num_x_offset = 22
-        self.num_y_offset = 14
-        self.line_coordinates = create_line_coordinates(self.cell_size)
-        self.grid = create_grid(SUB_GRID_SIZE)
-        self.game_font = font
-
-    def draw_lines(self, pg, surface):
-        for index, point in enumerate(self.line_coordinates):
-            if index==2 or index==5 or index==10 or index==13:
-                pg.draw.line(surface, (255,200,0), point[0], point[1])
+@lru_cache(maxsize=None)
+def solver_layout(size):
+    box = isqrt(size)
+    if box * box != size:
+        raise ValueError(f"Board size must be a square number, got {size}")
+    cells = range(size * size)
+    row_of = [i // size for i in cells]
+    col_of = [i % size for i in cells]
+    box_of = [(r // box) * box + c // box for r, c in zip(row_of, col_of)]
+    units = [[r * size + c for c in range(size)] for r in range(size)]
+    units += [[r * size + c for r in range(size)] for c in range(size)]
+    units += [[i for i in cells if box_of[i] == b] for b in range(size)]
+    return row_of, col_of, box_of, units
+
+
+def load_board(board):
+    size = len(board)
+    row_of, col_of, box_of, _ = solver_layout(size)
+    values = [value for row in board for value in row]
+    rows, cols, boxes = [0] * size, [0] * size, [0] * size
+    for i, value in enumerate(values):
+        if value:
+            bit = 1 << (value - 1)
+            r, c, b = row_of[i], col_of[i], box_of[i]
+            if (rows[r] | cols[c] | boxes[b]) & bit:
+                return None
+            rows[r] |= bit
+            cols[c] |= bit
+            boxes[b] |= bit
+    return values, rows, cols, boxes
+
+
+def propagate(values, rows, cols, boxes, steps=None):
+    size = len(rows)
+    full = (1 << size) - 1
+    row_of, col_of, box_of, units = solver_layout(size)
+    empty = [i for i, value in enumerate(values) if not value]
+
+    while True:
+        changed = False
+        candidates = [0] * len(values)
+        remaining = []
+        for i in empty:
+            if values[i]:
+                continue
+            r, c, b = row_of[i], col_of[i], box_of[i]
+            options = full & ~(rows[r] | cols[c] | boxes[b])
+            if not options:
+                return None
+            if options & (options - 1):
+                candidates[i] = options
+                remaining.append(i)
             else:
-                pg.draw.line(surface, (0,50,0), point[0], point[1])
+                values[i] = options.bit_length()
+                rows[r] |= options
+                cols[c] |= options
+                boxes[b] |= options
+                changed = True
+                if steps is not None:
+                    steps['naked'] += 1
+        empty = remaining
+        if changed:
+            continue
+
+        for unit in units:
+            once = twice = placed = 0
+            for i in unit:
+                if values[i]:
+                    placed |= 1 << (values[i] - 1)
+                else:
+                    twice |= once & candidates[i]
+                    once |= candidates[i]
+            if once | placed != full:
+                return None
+            hidden = once & ~twice
+            while hidden:
+                bit = hidden & -hidden
+                hidden ^= bit
+                i = next(i for i in unit if candidates[i] & bit)
+                if values[i]:
+                    return None
+                values[i] = bit.bit_length()
+                rows[row_of[i]] |= bit
+                cols[col_of[i]] |= bit
+                boxes[box_of[i]] |= bit
+                changed = True
+                if steps is not None:
+                    steps['hidden'] += 1
+            if changed:
+                break
+        if not changed:
+            return candidates
+
+
+def search(values, rows, cols, boxes, solutions, limit):
+    candidates = propagate(values, rows, cols, boxes)
+    if candidates is None:
+        return
+    size = len(rows)
+    row_of, col_of, box_of, _ = solver_layout(size)
+
+    best, best_count = -1, size + 1
+    for i, options in enumerate(candidates):
+        if options:
+            count = bin(options).count('1')
+            if count < best_count:
+                best, best_count = i, count
+                if count == 2:
+                    break
+    if best < 0:
+        solutions.append(values)
+        return
+
+    options = candidates[best]
+    r, c, b = row_of[best], col_of[best], box_of[best]
+    while options:
+        bit = options & -options
+        options ^= bit
+        next_values = values[:]
+        next_rows, next_cols, next_boxes = rows[:], cols[:], boxes[:]
+        next_values[best] = bit.bit_length()
+        next_rows[r] |= bit
+        next_cols[c] |= bit
+        next_boxes[b] |= bit
+        search(next_values, next_rows, next_cols, next_boxes, solutions, limit)
+        if len(solutions) >= limit:
+            return
+
+
+def find_solutions(board, limit):
+    state = load_board(board)
+    if state is None:
+        return []
+    solutions = []
+    search(*state, solutions, limit)
+    return solutions
+
+
+def solve(board):
+    solutions = find_solutions(board, 1)
+    if not solutions:
+        return None
+    size = len(board)
+    values = solutions[0]
+    return [values[y * size:(y + 1) * size] for y in range(size)]
 
-    def draw_numbers(self, surface):
-        for y in range(len(self.grid)):
-            for x in range(len(self.grid[y])):
-                if self.get_cell(x,y) != 0:
-                    color = (0, 255, 0) if hasattr(self, 'correct_cells') and (x,y) in self.correct_cells else (0, 200, 255)
-                    text_surface = self.game_font.render(str(self.get_cell(x,y)), False, color)
-                    surface.blit(text_surface, (x*self.cell_size + self.num_x_offset, y*self.cell_size + self.num_y_offset))
 
-    def draw_all(self, pg, surface):
-        self.draw_lines(pg, surface)
-        self.draw_numbers(surface)
+def count_solutions(board, limit=2):
+    return len(find_solutions(board, limit))
+
+
+def has_unique_solution(board):
+    size = len(board)
+    digits = {value for row in board for value in row if value}
+    if len(digits) < size - 1:
+        return False
+    if size == 9 and sum(1 for row in board for value in row if value) < 17:
+        return False
+    return count_solutions(board, 2) == 1
+
+
+class Grid:
+    __slots__ = ('size', 'box', 'correct_cells', 'cells', 'solution_cells', 'empty_count', 'rows', 'cols', 'boxes',
+                 'counts')
+
+    def __init__(self, board=None, solution=None, sub_grid=SUB_GRID_SIZE):
+        self.correct_cells = set()
+        self.solution_cells = None
+        if board is None:
+            board = create_grid(sub_grid)
+        if solution is None:
+            self.load_board(board)
+        else:
+            self.load_puzzle(board, solution)
+
+    def load_board(self, board):
+        self.size = len(board)
+        self.box = isqrt(self.size)
+        self.cells = bytearray(value for row in board for value in row)
+        self.empty_count = self.cells.count(0)
+        self.rows = array('L', [0]) * self.size
+        self.cols = array('L', [0]) * self.size
+        self.boxes = array('L', [0]) * self.size
+        self.counts = bytearray(3 * self.size * self.size)
+        for index, value in enumerate(self.cells):
+            if value:
+                self.mark(index, value, 1)
+
+    def mark(self, index, value, delta):
+        size = self.size
+        y, x = divmod(index, size)
+        box = (y // self.box) * self.box + x // self.box
+        bit = 1 << (value - 1)
+        counts = self.counts
+        row_slot = y * size + value - 1
+        col_slot = (size + x) * size + value - 1
+        box_slot = (2 * size + box) * size + value - 1
+        counts[row_slot] += delta
+        counts[col_slot] += delta
+        counts[box_slot] += delta
+        if delta > 0:
+            self.rows[y] |= bit
+            self.cols[x] |= bit
+            self.boxes[box] |= bit
+            return
+        if not counts[row_slot]:
+            self.rows[y] &= ~bit
+        if not counts[col_slot]:
+            self.cols[x] &= ~bit
+        if not counts[box_slot]:
+            self.boxes[box] &= ~bit
+
+    def contains(self, x, y):
+        return 0 <= x < self.size and 0 <= y < self.size
 
     def get_cell(self, x, y ):
-        return self.grid[y][x]
+        return self.cells[y * self.size + x]
     
     def set_cell(self, x, y, value):
-        self.grid[y][x]=value
+        index = y * self.size + x
+        old = self.cells[index]
+        if old == value:
+            return
+        if old:
+            self.mark(index, old, -1)
+        else:
+            self.empty_count -= 1
+        if value:
+            self.mark(index, value, 1)
+        else:
+            self.empty_count += 1
+        self.cells[index] = value
+
+    def can_place(self, x, y, value):
+        bit = 1 << (value - 1)
+        box = (y // self.box) * self.box + x // self.box
+        return (self.cells[y * self.size + x] == 0
+                and not (self.rows[y] | self.cols[x] | self.boxes[box]) & bit)
+
+    def is_correct(self, x, y, value):
+        return self.solution_cells[y * self.size + x] == value
+
+    def is_complete(self):
+        return self.empty_count == 0
 
     def show(self):
-        for cell in self.grid:
-            print(cell)
+        for row in self.get_board():
+            print(row)
 
     def get_board(self):
-        return self.grid
-    
-    def remove_numbers(self, count):
-        self.solution = [row[:] for row in self.grid]
+        return [list(self.cells[y * self.size:(y + 1) * self.size]) for y in range(self.size)]
+
+    @property
+    def grid(self):
+        return self.get_board()
+
+    @grid.setter
+    def grid(self, board):
+        self.load_board(board)
+
+    @property
+    def solution(self):
+        return [list(self.solution_cells[y * self.size:(y + 1) * self.size]) for y in range(self.size)]
+
+    def load_puzzle(self, board, solution):
+        self.load_board(board)
+        self.solution_cells = bytes(value for row in solution for value in row)
+
+    def remove_numbers(self, count, rng=random):
+        self.solution_cells = bytes(self.cells)
 
-        positions = [(x, y) for x in range(GRID_SIZE) for y in range(GRID_SIZE)]
+        positions = [(x, y) for x in range(self.size) for y in range(self.size)]
 
-        to_remove = sample(positions, count)
+        to_remove = rng.sample(positions, count)
 
         for x, y in to_remove:
-            self.grid[y][x] = 0
+            self.set_cell(x, y, 0)
 
 if __name__ == '__main__':
     grid = Grid()
@@ -0,0 +1,255 @@
+import os
+import struct
+import threading
+import zlib
+import protocol
+from bank import difficulty_code, difficulty_name, ANY_CLUES
+from generator import Puzzle
+from room import Room
+
+MAGIC = b'SDKJ'
+VERSION = 3
+SNAPSHOT_HEADER = struct.Struct('!4sHQ')
+FRAME = struct.Struct('!BHI')
+CHECKSUM = struct.Struct('!I')
+SEAT = struct.Struct('!BQB')
+TOKEN = struct.Struct('!BQ')
+LEAVE = struct.Struct('!B')
+PUZZLE = struct.Struct('!BBQBB')
+
+ROOM_RECORD, STATE_RECORD, SEAT_RECORD, MOVE_RECORD, LEAVE_RECORD, CLOSE_RECORD, TOKEN_RECORD = range(7)
+CORRECT = protocol.RESULT_CODES['correct']
+INCORRECT = protocol.RESULT_CODES['incorrect']
+
+SNAPSHOT_FILE = 'snapshot.bin'
+JOURNAL_PREFIX = 'journal.'
+FLUSH_INTERVAL = 0.05
+
+
+class JournalError(ValueError):
+    pass
+
+
+def encode_frame(kind, match_id, body=b''):
+    frame = FRAME.pack(kind, len(body), match_id) + body
+    return frame + CHECKSUM.pack(zlib.crc32(frame))
+
+
+def decode_frames(data, offset=0):
+    frames = []
+    while offset + FRAME.size <= len(data):
+        kind, length, match_id = FRAME.unpack_from(data, offset)
+        end = offset + FRAME.size + length
+        if end + CHECKSUM.size > len(data) or CHECKSUM.unpack_from(data, end)[0] != zlib.crc32(data[offset:end]):
+            break
+        frames.append((kind, match_id, data[offset + FRAME.size:end]))
+        offset = end + CHECKSUM.size
+    return frames, offset
+
+
+def encode_puzzle(puzzle):
+    clue_target = ANY_CLUES if puzzle.clue_target is None else puzzle.clue_target
+    header = PUZZLE.pack(puzzle.size, difficulty_code(puzzle.difficulty), puzzle.seed or 0,
+                         difficulty_code(puzzle.tier), clue_target)
+    return header + protocol.pack_board(puzzle.board) + protocol.pack_board(puzzle.solution)
+
+
+def decode_puzzle(body):
+    size, difficulty, seed, tier, clue_target = PUZZLE.unpack_from(body)
+    board_end = PUZZLE.size + protocol.board_bytes(size)
+    return Puzzle(protocol.unpack_board(body[PUZZLE.size:board_end], size),
+                  protocol.unpack_board(body[board_end:], size), difficulty_name(difficulty),
+                  seed=seed or None, tier=difficulty_name(tier),
+                  clue_target=None if clue_target == ANY_CLUES else clue_target)
+
+
+def room_frame(room):
+    return encode_frame(ROOM_RECORD, room.match_id, encode_puzzle(room.puzzle))
+
+
+def seat_frame(room, player_number, token):
+    return encode_frame(SEAT_RECORD, room.match_id, SEAT.pack(player_number, token or 0, room.current_turn))
+
+
+def move_frame(room, delta):
+    return encode_frame(MOVE_RECORD, room.match_id, protocol.DELTA.pack(
+        delta['seq'], protocol.RESULT_CODES[delta['result']], delta['player'], delta.get('x', 0),
+        delta.get('y', 0), delta.get('value', 0), delta['current_turn']))
+
+
+def leave_frame(room, player_number):
+    return encode_frame(LEAVE_RECORD, room.match_id, LEAVE.pack(player_number))
+
+
+def close_frame(room):
+    return encode_frame(CLOSE_RECORD, room.match_id)
+
+
+def snapshot_frames(room):
+    state = protocol.pack_state({
+        'seq': room.seq,
+        'current_turn': room.current_turn,
+        'scores': room.scores,
+        'board': room.grid.get_board(),
+        'correct_cells': room.correct_cells
+    })
+    frames = [room_frame(room), encode_frame(STATE_RECORD, room.match_id, state)]
+    for player_number, token in room.tokens.items():
+        frames.append(encode_frame(TOKEN_RECORD, room.match_id, TOKEN.pack(player_number, token)))
+    return frames
+
+
+def apply_frame(rooms, kind, match_id, body):
+    if kind == ROOM_RECORD:
+        rooms[match_id] = Room(match_id, decode_puzzle(body))
+        return
+    room = rooms.get(match_id)
+    if room is None:
+        return
+    if kind == STATE_RECORD:
+        state = protocol.unpack_state(body, {})
+        room.grid.load_puzzle(state['board'], room.puzzle.solution)
+        room.seq = state['seq']
+        room.current_turn = state['current_turn']
+        room.scores = state['scores']
+        room.correct_cells = state['correct_cells']
+    elif kind == TOKEN_RECORD:
+        player_number, token = TOKEN.unpack(body)
+        room.tokens[player_number] = token
+    elif kind == SEAT_RECORD:
+        player_number, token, current_turn = SEAT.unpack(body)
+        room.occupy(player_number, token or None)
+        room.current_turn = current_turn
+    elif kind == MOVE_RECORD:
+        seq, result, player_number, x, y, value, current_turn = protocol.DELTA.unpack(body)
+        if result == CORRECT:
+            room.grid.set_cell(x, y, value)
+            room.correct_cells.add((x, y))
+            room.scores[player_number] += 1
+        elif result == INCORRECT:
+            room.scores[player_number] -= 1
+        room.seq = seq
+        room.current_turn = current_turn
+    elif kind == LEAVE_RECORD:
+        room.tokens.pop(LEAVE.unpack(body)[0], None)
+    elif kind == CLOSE_RECORD:
+        del rooms[match_id]
+
+
+def journal_path(directory, generation):
+    return os.path.join(directory, f'{JOURNAL_PREFIX}{generation}')
+
+
+def recover(directory):
+    os.makedirs(directory, exist_ok=True)
+    generation = 0
+    rooms = {}
+    replayed = 0
+    snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, 'rb') as f:
+            data = f.read()
+        if len(data) < SNAPSHOT_HEADER.size:
+            raise JournalError(f"{snapshot_path} is truncated")
+        magic, version, generation = SNAPSHOT_HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise JournalError(f"{snapshot_path} is not a version {VERSION} snapshot")
+        frames, _ = decode_frames(data, SNAPSHOT_HEADER.size)
+        for frame in frames:
+            apply_frame(rooms, *frame)
+
+    path = journal_path(directory, generation)
+    if os.path.exists(path):
+        with open(path, 'r+b') as f:
+            data = f.read()
+            frames, valid = decode_frames(data)
+            if valid < len(data):
+                print(f"Discarding {len(data) - valid} bytes of torn journal tail")
+                f.truncate(valid)
+        for frame in frames:
+            apply_frame(rooms, *frame)
+        replayed = len(frames)
+
+    for name in os.listdir(directory):
+        if name.startswith(JOURNAL_PREFIX) and name != os.path.basename(path):
+            os.remove(os.path.join(directory, name))
+    return generation, rooms, replayed
+
+
+class Journal:
+    def __init__(self, directory, generation=0, flush_interval=FLUSH_INTERVAL):
+        self.directory = directory
+        self.generation = generation
+        self.flush_interval = flush_interval
+        self.file = open(journal_path(directory, generation), 'ab')
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.buffer = []
+        self.pending_snapshot = None
+        self.records = 0
+        self.fsyncs = 0
+        self.snapshots = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='sudoku-journal', daemon=True)
+        self.thread.start()
+
+    def append(self, frame):
+        with self.lock:
+            self.buffer.append(frame)
+
+    def snapshot(self, frames):
+        with self.lock:
+            self.pending_snapshot = frames
+            self.buffer = []
+        self.wakeup.set()
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            snapshot, self.pending_snapshot = self.pending_snapshot, None
+            buffer, self.buffer = self.buffer, []
+        if snapshot is not None:
+            self.write_snapshot(snapshot)
+        if buffer:
+            self.file.write(b''.join(buffer))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.records += len(buffer)
+            self.fsyncs += 1
+
+    def write_snapshot(self, frames):
+        generation = self.generation + 1
+        journal = open(journal_path(self.directory, generation), 'wb')
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(SNAPSHOT_HEADER.pack(MAGIC, VERSION, generation))
+            f.write(b''.join(frames))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        directory = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self.file.close()
+        os.remove(journal_path(self.directory, self.generation))
+        self.file = journal
+        self.generation = generation
+        self.snapshots += 1
+
+    def stats(self):
+        return {'generation': self.generation, 'records': self.records, 'fsyncs': self.fsyncs,
+                'snapshots': self.snapshots}
+
+    def close(self):
+        self.running = False
+        self.wakeup.set()
+        self.thread.join()
+        self.flush()
+        self.file.close()
@@ -0,0 +1,176 @@
+import bisect
+import cProfile
+import io
+import pstats
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+PROFILE_LINES = 25
+
+
+def format_labels(label_name, label, extra=''):
+    labels = [f'{label_name}="{label}"'] if label_name and label is not None else []
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, label_name=None):
+        self.name = name
+        self.help = help
+        self.label_name = label_name
+        self.values = {}
+
+    def inc(self, label=None, amount=1):
+        self.values[label] = self.values.get(label, 0) + amount
+
+    def samples(self):
+        for label, value in list(self.values.items()):
+            yield self.name + format_labels(self.label_name, label), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, label_name=None, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_name = label_name
+        self.buckets = buckets
+        self.children = {}
+
+    def observe(self, value, label=None):
+        child = self.children.get(label)
+        if child is None:
+            child = self.children[label] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        child[0][bisect.bisect_left(self.buckets, value)] += 1
+        child[1] += value
+        child[2] += 1
+
+    def samples(self):
+        for label, (counts, total, observed) in list(self.children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), list(counts)):
+                cumulative += count
+                yield self.name + '_bucket' + format_labels(self.label_name, label, f'le="{bound}"'), cumulative
+            yield self.name + '_sum' + format_labels(self.label_name, label), total
+            yield self.name + '_count' + format_labels(self.label_name, label), observed
+
+
+class Collected:
+    def __init__(self, name, help, function, kind='gauge', label_name=None):
+        self.name = name
+        self.help = help
+        self.function = function
+        self.kind = kind
+        self.label_name = label_name
+
+    def samples(self):
+        if self.label_name is None:
+            yield self.name, self.function()
+            return
+        for label, value in self.function().items():
+            yield self.name + format_labels(self.label_name, label), value
+
+
+class Metrics:
+    def __init__(self, prefix='sudoku'):
+        self.prefix = prefix
+        self.families = []
+
+    def register(self, family):
+        family.name = f'{self.prefix}_{family.name}'
+        self.families.append(family)
+        return family
+
+    def counter(self, name, help, label_name=None):
+        return self.register(Counter(name, help, label_name))
+
+    def histogram(self, name, help, label_name=None, buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, label_name, buckets))
+
+    def collect(self, name, help, function, kind='gauge', label_name=None):
+        return self.register(Collected(name, help, function, kind, label_name))
+
+    def render(self):
+        lines = []
+        for family in self.families:
+            lines.append(f'# HELP {family.name} {family.help}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for name, value in family.samples():
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        try:
+            body = self.server.metrics.render().encode()
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    def __init__(self, metrics, host='127.0.0.1', port=9555):
+        self.httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.metrics = metrics
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='sudoku-metrics', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class Profiler:
+    def __init__(self, path=None):
+        self.path = path
+        self.profile = None
+
+    @property
+    def running(self):
+        return self.profile is not None
+
+    def toggle(self):
+        if self.profile is None:
+            self.start()
+        else:
+            self.stop()
+
+    def start(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        print("Profiling started")
+
+    def stop(self):
+        profile, self.profile = self.profile, None
+        if profile is None:
+            return
+        profile.disable()
+        if self.path:
+            profile.dump_stats(self.path)
+            print(f"Profile written to {self.path}")
+        report = io.StringIO()
+        pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        print(report.getvalue())
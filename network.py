@@ -0,0 +1,82 @@
+import socket
+import struct
+import threading
+import time
+from math import isqrt
+import pygame
+import protocol
+from generator import generate_puzzle
+from reliable import ReliableEndpoint
+
+NETWORK_EVENT = pygame.event.custom_type()
+MAX_DATAGRAM = 65535
+POLL_INTERVAL = 0.25
+SERVER_TIMEOUT = 15.0
+
+
+class ClientNetwork:
+    def __init__(self, sock):
+        self.socket = sock
+        self.server_addr = None
+        self.link = ReliableEndpoint(self.socket.sendto)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.running = False
+
+    def send(self, message):
+        reliable = message['type'] in protocol.RELIABLE_TYPES
+        with self.lock:
+            self.link.send(protocol.encode(message), self.server_addr, reliable)
+
+    def receive(self, data):
+        with self.lock:
+            payloads = self.link.receive(data, self.server_addr)
+        messages = [protocol.decode(payload) for payload in payloads]
+        for message in messages:
+            if message['type'] == 'start':
+                message['board'] = generate_puzzle(message['difficulty'], message['clues'],
+                                                   sub_grid=isqrt(message['size']), seed=message['seed']).board
+        return messages
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='sudoku-network', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(POLL_INTERVAL * 2)
+            self.thread = None
+
+    def post(self, message):
+        pygame.event.post(pygame.event.Event(NETWORK_EVENT, message=message))
+
+    def run(self):
+        last_heard = time.monotonic()
+        while self.running:
+            with self.lock:
+                timeout = self.link.next_delay(POLL_INTERVAL)
+            self.socket.settimeout(min(max(timeout, 0.001), POLL_INTERVAL))
+            try:
+                data, _ = self.socket.recvfrom(MAX_DATAGRAM)
+            except (socket.timeout, ConnectionRefusedError):
+                pass
+            except OSError:
+                break
+            else:
+                last_heard = time.monotonic()
+                try:
+                    for message in self.receive(data):
+                        if message['type'] == 'ping':
+                            self.send({'type': 'ping'})
+                        else:
+                            self.post(message)
+                except (ValueError, struct.error) as e:
+                    print(f"Dropped malformed datagram: {e}")
+
+            with self.lock:
+                failed = self.link.poll()
+            if failed or time.monotonic() - last_heard > SERVER_TIMEOUT:
+                last_heard = time.monotonic()
+                self.post({'type': 'lost'})
@@ -0,0 +1,111 @@
+import random
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from generator import generate_puzzle, check_target
+from grid import SUB_GRID_SIZE
+
+
+def ignore_sigint():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def tier_name(key):
+    tier, sub_grid = key
+    return f'{tier or "any"}/{sub_grid * sub_grid}'
+
+
+class PuzzlePool:
+    def __init__(self, tiers=(None,), size=16, low_water=None, clues=None, workers=1, processes=True,
+                 sub_grids=(SUB_GRID_SIZE,), sizes=None):
+        self.clues = clues
+        self.seeds = random.SystemRandom()
+        keys = [(tier, sub_grid) for sub_grid in sub_grids for tier in tiers]
+        sizes = sizes or {}
+        self.size = {key: sizes.get(key[1], size) for key in keys}
+        self.low_water = {key: self.size[key] // 2 if low_water is None else low_water for key in keys}
+        for tier, sub_grid in keys:
+            check_target(tier, self.clues_for(sub_grid), sub_grid)
+        self.puzzles = {key: deque() for key in keys}
+        self.pending = {key: 0 for key in keys}
+        self.lock = threading.Lock()
+        if processes:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=ignore_sigint)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.closed = False
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.failures = 0
+        self.refill_time = 0.0
+        self.max_refill_time = 0.0
+        for key in keys:
+            self.refill(key)
+
+    def clues_for(self, sub_grid):
+        return self.clues if sub_grid == SUB_GRID_SIZE else None
+
+    def get(self, tier=None, sub_grid=SUB_GRID_SIZE):
+        key = (tier, sub_grid)
+        try:
+            puzzle = self.puzzles[key].popleft()
+            self.hits += 1
+        except IndexError:
+            self.misses += 1
+            self.refill(key)
+            return generate_puzzle(tier, self.clues_for(sub_grid), sub_grid=sub_grid,
+                                   seed=self.seeds.getrandbits(64))
+        except KeyError:
+            raise ValueError(f"Puzzle pool does not hold tier {tier!r} with {sub_grid}x{sub_grid} boxes") from None
+        if len(self.puzzles[key]) + self.pending[key] < self.low_water[key]:
+            self.refill(key)
+        return puzzle
+
+    def refill(self, key):
+        tier, sub_grid = key
+        with self.lock:
+            if self.closed:
+                return
+            missing = self.size[key] - len(self.puzzles[key]) - self.pending[key]
+            self.pending[key] += max(0, missing)
+        for _ in range(missing):
+            future = self.executor.submit(generate_puzzle, tier, self.clues_for(sub_grid), sub_grid=sub_grid,
+                                          seed=self.seeds.getrandbits(64))
+            future.add_done_callback(lambda future, key=key, start=time.perf_counter():
+                                     self.refilled(key, start, future))
+
+    def refilled(self, key, start, future):
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.pending[key] -= 1
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                self.failures += 1
+                print(f"Puzzle pool refill for {tier_name(key)} failed: {error!r}")
+                return
+            self.puzzles[key].append(future.result())
+            self.refills += 1
+            self.refill_time += elapsed
+            self.max_refill_time = max(self.max_refill_time, elapsed)
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'refills': self.refills,
+            'failures': self.failures,
+            'avg_refill_time': self.refill_time / self.refills if self.refills else 0.0,
+            'max_refill_time': self.max_refill_time,
+            'ready': {tier_name(key): len(puzzles) for key, puzzles in self.puzzles.items()},
+            'pending': {tier_name(key): pending for key, pending in self.pending.items()}
+        }
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+        self.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,199 @@
+import struct
+from functools import lru_cache
+from generator import DIFFICULTIES
+
+VERSION = 4
+BOARD_SIZES = (9, 16, 25)
+MAX_BOARD_SIZE = max(BOARD_SIZES)
+
+MESSAGE_TYPES = ['join', 'init', 'move', 'update', 'incorrect', 'game_end', 'ping', 'disconnect',
+                 'delta', 'sync', 'watch', 'start']
+TYPE_CODES = {name: code for code, name in enumerate(MESSAGE_TYPES)}
+RELIABLE_TYPES = frozenset(['init', 'move', 'update', 'game_end', 'delta', 'start'])
+DELTA_RESULTS = ['pass', 'correct', 'incorrect']
+RESULT_CODES = {name: code for code, name in enumerate(DELTA_RESULTS)}
+
+HEADER = struct.Struct('!BB')
+JOIN = struct.Struct('!IQB')
+WATCH = struct.Struct('!I')
+MOVE = struct.Struct('!BBB')
+STATE = struct.Struct('!IBiiB')
+INIT = struct.Struct('!IB')
+DELTA = struct.Struct('!IBBBBBB')
+START = struct.Struct('!IBBQBBB')
+SPECTATOR = 255
+ANY = 255
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+NIBBLES = [bytes((byte >> 4, byte & 0x0F)) for byte in range(256)]
+BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+
+
+def board_bytes(size):
+    return (size * size + 1) // 2 if size < 16 else size * size
+
+
+def mask_bytes(size):
+    return (size * size + 7) // 8
+
+
+@lru_cache(maxsize=None)
+def cell_coords(size):
+    return [(index % size, index // size) for index in range(mask_bytes(size) * 8)]
+
+
+def pack_board(board):
+    cells = [value for row in board for value in row]
+    if len(board) >= 16:
+        return bytes(cells)
+    cells.append(0)
+    return bytes([high << 4 | low for high, low in zip(cells[0::2], cells[1::2])])
+
+
+def unpack_board(data, size=9):
+    cells = data if size >= 16 else b''.join([NIBBLES[byte] for byte in data])
+    return [list(cells[y * size:y * size + size]) for y in range(size)]
+
+
+def pack_cells(correct_cells, size=9):
+    mask = 0
+    for x, y in correct_cells:
+        mask |= 1 << (y * size + x)
+    return mask.to_bytes(mask_bytes(size), 'big')
+
+
+def unpack_cells(data, size=9):
+    coords = cell_coords(size)
+    cells = set()
+    base = len(data) * 8
+    for byte in data:
+        base -= 8
+        for bit in BYTE_BITS[byte]:
+            cells.add(coords[base + bit])
+    return cells
+
+
+def pack_state(message):
+    scores = message['scores']
+    board = message['board']
+    return (STATE.pack(message.get('seq', 0), message.get('current_turn', 0), scores.get(0, 0), scores.get(1, 0),
+                       len(board))
+            + pack_board(board) + pack_cells(message['correct_cells'], len(board)))
+
+
+def unpack_state(data, message):
+    seq, current_turn, score_0, score_1, size = STATE.unpack_from(data)
+    if size not in BOARD_SIZES:
+        raise ProtocolError(f"Unsupported board size: {size}")
+    board_end = STATE.size + board_bytes(size)
+    if len(data) != board_end + mask_bytes(size):
+        raise ProtocolError(f"Malformed state for a {size}x{size} board")
+    message['seq'] = seq
+    message['current_turn'] = current_turn
+    message['scores'] = {0: score_0, 1: score_1}
+    message['board'] = unpack_board(data[STATE.size:board_end], size)
+    message['correct_cells'] = unpack_cells(data[board_end:], size)
+    return message
+
+
+def encode(message):
+    kind = message['type']
+    code = TYPE_CODES.get(kind)
+    if code is None:
+        raise ProtocolError(f"Unknown message type: {kind!r}")
+    header = HEADER.pack(VERSION, code)
+
+    if kind == 'join':
+        return header + JOIN.pack(message.get('match_id') or 0, message.get('token') or 0,
+                                  message.get('size') or 0)
+    if kind == 'watch':
+        return header + WATCH.pack(message.get('match_id') or 0)
+    if kind == 'move':
+        return header + MOVE.pack(message['x'], message['y'], message['value'])
+    if kind == 'init':
+        return header + INIT.pack(message['match_id'], message['player_number']) + pack_state(message)
+    if kind == 'start':
+        difficulty = ANY if message['difficulty'] is None else DIFFICULTIES.index(message['difficulty'])
+        clues = ANY if message['clues'] is None else message['clues']
+        return header + START.pack(message['match_id'], message['player_number'], message['current_turn'],
+                                   message['seed'], difficulty, clues, message['size'])
+    if kind in ('update', 'game_end'):
+        return header + pack_state(message)
+    if kind == 'incorrect':
+        move = message['incorrect_move']
+        return header + MOVE.pack(move['x'], move['y'], move['value']) + pack_state(message)
+    if kind == 'delta':
+        return header + DELTA.pack(message['seq'], RESULT_CODES[message['result']], message['player'],
+                                   message.get('x', 0), message.get('y', 0), message.get('value', 0),
+                                   message['current_turn'])
+    return header
+
+
+def decode(data):
+    if len(data) < HEADER.size:
+        raise ProtocolError("Truncated message")
+    version, code = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported protocol version: {version}")
+    if code >= len(MESSAGE_TYPES):
+        raise ProtocolError(f"Unknown message code: {code}")
+    kind = MESSAGE_TYPES[code]
+    body = data[HEADER.size:]
+    message = {'type': kind}
+
+    try:
+        if kind == 'join':
+            match_id, token, size = JOIN.unpack(body)
+            if match_id:
+                message['match_id'] = match_id
+            if token:
+                message['token'] = token
+            if size:
+                if size not in BOARD_SIZES:
+                    raise ProtocolError(f"Unsupported board size: {size}")
+                message['size'] = size
+        elif kind == 'watch':
+            match_id, = WATCH.unpack(body)
+            if match_id:
+                message['match_id'] = match_id
+        elif kind == 'move':
+            message['x'], message['y'], message['value'] = MOVE.unpack(body)
+            if (message['x'] >= MAX_BOARD_SIZE or message['y'] >= MAX_BOARD_SIZE
+                    or not 1 <= message['value'] <= MAX_BOARD_SIZE):
+                raise ProtocolError("Move out of range")
+        elif kind == 'init':
+            message['match_id'], message['player_number'] = INIT.unpack_from(body)
+            unpack_state(body[INIT.size:], message)
+        elif kind == 'start':
+            (message['match_id'], message['player_number'], message['current_turn'], message['seed'],
+             difficulty, clues, message['size']) = START.unpack(body)
+            if message['size'] not in BOARD_SIZES:
+                raise ProtocolError(f"Unsupported board size: {message['size']}")
+            if difficulty != ANY and difficulty >= len(DIFFICULTIES):
+                raise ProtocolError(f"Unknown difficulty: {difficulty}")
+            message['difficulty'] = None if difficulty == ANY else DIFFICULTIES[difficulty]
+            message['clues'] = None if clues == ANY else clues
+            message['seq'] = 0
+            message['scores'] = {0: 0, 1: 0}
+            message['correct_cells'] = set()
+        elif kind in ('update', 'game_end'):
+            unpack_state(body, message)
+        elif kind == 'incorrect':
+            x, y, value = MOVE.unpack_from(body)
+            unpack_state(body[MOVE.size:], message)
+            message['incorrect_move'] = {'x': x, 'y': y, 'value': value}
+        elif kind == 'delta':
+            (message['seq'], result, message['player'], message['x'], message['y'],
+             message['value'], message['current_turn']) = DELTA.unpack(body)
+            if result >= len(DELTA_RESULTS):
+                raise ProtocolError(f"Unknown delta result: {result}")
+            message['result'] = DELTA_RESULTS[result]
+        elif body:
+            raise ProtocolError(f"Unexpected payload for {kind}")
+    except struct.error as e:
+        raise ProtocolError(f"Malformed {kind} message: {e}") from None
+    return message
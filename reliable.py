@@ -0,0 +1,242 @@
+import heapq
+import random
+import struct
+import time
+from collections import deque
+from itertools import count
+
+UNRELIABLE = 0
+DATA = 1
+ACK = 2
+
+KIND = struct.Struct('!B')
+DATA_HEADER = struct.Struct('!BIBB')
+ACK_HEADER = struct.Struct('!BIQ')
+
+MAX_PAYLOAD = 1200
+MAX_FRAGMENTS = 255
+SACK_BITS = 64
+WINDOW = 64
+INITIAL_RTO = 0.2
+MIN_RTO = 0.05
+MAX_RTO = 3.0
+MAX_RETRIES = 8
+
+
+class Pending:
+    __slots__ = ('packet', 'sent_at', 'deadline', 'retries')
+
+    def __init__(self, packet, now, rto):
+        self.packet = packet
+        self.sent_at = now
+        self.deadline = now + rto
+        self.retries = 0
+
+
+class Channel:
+    def __init__(self):
+        self.next_seq = 0
+        self.unacked = {}
+        self.backlog = deque()
+        self.acked = 0
+        self.expected = 0
+        self.received = {}
+        self.fragments = []
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = INITIAL_RTO
+        self.sent = 0
+        self.retransmits = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.failed = False
+
+    def sample_rtt(self, rtt):
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+        self.rto = min(MAX_RTO, max(MIN_RTO, self.srtt + 4 * self.rttvar))
+
+    def ack_mask(self):
+        mask = 0
+        for bit in range(SACK_BITS):
+            if self.expected + 1 + bit in self.received:
+                mask |= 1 << bit
+        return mask
+
+    def stats(self):
+        return {
+            'rtt': self.srtt,
+            'rto': self.rto,
+            'sent': self.sent,
+            'retransmits': self.retransmits,
+            'lost': self.lost,
+            'duplicates': self.duplicates,
+            'dropped': self.dropped,
+            'in_flight': len(self.unacked),
+            'queued': len(self.backlog),
+            'loss_rate': self.retransmits / self.sent if self.sent else 0.0
+        }
+
+
+class ReliableEndpoint:
+    def __init__(self, sendto, clock=time.monotonic):
+        self.sendto = sendto
+        self.clock = clock
+        self.channels = {}
+        self.deadlines = []
+        self.sequence = count()
+
+    def channel(self, addr):
+        channel = self.channels.get(addr)
+        if channel is None:
+            channel = self.channels[addr] = Channel()
+        return channel
+
+    def forget(self, addr):
+        self.channels.pop(addr, None)
+
+    def send(self, data, addr, reliable=True):
+        if not reliable:
+            self.sendto(KIND.pack(UNRELIABLE) + data, addr)
+            return
+
+        chunks = [data[i:i + MAX_PAYLOAD] for i in range(0, len(data), MAX_PAYLOAD)] or [b'']
+        if len(chunks) > MAX_FRAGMENTS:
+            raise ValueError(f"Message too large to fragment: {len(data)} bytes")
+
+        channel = self.channel(addr)
+        for index, chunk in enumerate(chunks):
+            seq = channel.next_seq
+            channel.next_seq += 1
+            channel.backlog.append((seq, DATA_HEADER.pack(DATA, seq, index, len(chunks)) + chunk))
+        self.flush(channel, addr)
+
+    def flush(self, channel, addr):
+        now = self.clock()
+        while channel.backlog and channel.backlog[0][0] < channel.acked + WINDOW:
+            seq, packet = channel.backlog.popleft()
+            pending = channel.unacked[seq] = Pending(packet, now, channel.rto)
+            self.schedule(addr, channel, seq, pending)
+            channel.sent += 1
+            self.sendto(packet, addr)
+
+    def receive(self, packet, addr):
+        if not packet:
+            return []
+        kind = packet[0]
+        if kind == UNRELIABLE:
+            return [packet[KIND.size:]]
+        if kind == ACK:
+            _, cumulative, mask = ACK_HEADER.unpack_from(packet)
+            self.handle_ack(addr, cumulative, mask)
+            return []
+        if kind != DATA:
+            raise ValueError(f"Unknown packet kind: {kind}")
+
+        _, seq, index, count = DATA_HEADER.unpack_from(packet)
+        if index >= count:
+            raise ValueError(f"Bad fragment {index} of {count}")
+        channel = self.channel(addr)
+        if seq < channel.expected or seq in channel.received:
+            channel.duplicates += 1
+        elif seq >= channel.expected + WINDOW:
+            channel.dropped += 1
+        else:
+            channel.received[seq] = (index, count, packet[DATA_HEADER.size:])
+
+        delivered = []
+        while channel.expected in channel.received:
+            index, count, chunk = channel.received.pop(channel.expected)
+            channel.expected += 1
+            if index != len(channel.fragments):
+                channel.fragments = []
+                channel.dropped += 1
+                if index:
+                    continue
+            channel.fragments.append(chunk)
+            if index == count - 1:
+                delivered.append(b''.join(channel.fragments))
+                channel.fragments = []
+
+        self.sendto(ACK_HEADER.pack(ACK, channel.expected, channel.ack_mask()), addr)
+        return delivered
+
+    def handle_ack(self, addr, cumulative, mask):
+        channel = self.channels.get(addr)
+        if channel is None:
+            return
+        now = self.clock()
+        channel.acked = max(channel.acked, cumulative)
+        for seq in list(channel.unacked):
+            offset = seq - cumulative - 1
+            if seq < cumulative or (0 <= offset < SACK_BITS and mask >> offset & 1):
+                pending = channel.unacked.pop(seq)
+                if pending.retries == 0:
+                    channel.sample_rtt(now - pending.sent_at)
+        self.flush(channel, addr)
+
+    def schedule(self, addr, channel, seq, pending):
+        heapq.heappush(self.deadlines, (pending.deadline, next(self.sequence), addr, channel, seq, pending))
+
+    def is_current(self, entry):
+        deadline, _, addr, channel, seq, pending = entry
+        return (pending.deadline == deadline and channel.unacked.get(seq) is pending
+                and self.channels.get(addr) is channel)
+
+    def poll(self):
+        now = self.clock()
+        failed = []
+        while self.deadlines and self.deadlines[0][0] <= now:
+            entry = heapq.heappop(self.deadlines)
+            if not self.is_current(entry):
+                continue
+            _, _, addr, channel, seq, pending = entry
+            if pending.retries >= MAX_RETRIES:
+                del channel.unacked[seq]
+                channel.lost += 1
+                if not channel.failed:
+                    channel.failed = True
+                    failed.append(addr)
+                continue
+            pending.retries += 1
+            pending.deadline = now + channel.rto * (2 ** pending.retries)
+            self.schedule(addr, channel, seq, pending)
+            channel.retransmits += 1
+            self.sendto(pending.packet, addr)
+        return failed
+
+    def next_delay(self, default=None):
+        while self.deadlines and not self.is_current(self.deadlines[0]):
+            heapq.heappop(self.deadlines)
+        if not self.deadlines:
+            return default
+        return max(0.0, self.deadlines[0][0] - self.clock())
+
+    def peer_stats(self, addr):
+        channel = self.channels.get(addr)
+        return channel.stats() if channel is not None else None
+
+
+class LossySocket:
+    def __init__(self, sock, loss=0.1, duplicate=0.0, seed=None):
+        self.sock = sock
+        self.loss = loss
+        self.duplicate = duplicate
+        self.random = random.Random(seed)
+        self.dropped = 0
+
+    def sendto(self, data, addr):
+        if self.random.random() < self.loss:
+            self.dropped += 1
+            return len(data)
+        if self.random.random() < self.duplicate:
+            self.sock.sendto(data, addr)
+        return self.sock.sendto(data, addr)
+
+    def __getattr__(self, name):
+        return getattr(self.sock, name)
@@ -0,0 +1,203 @@
+import time
+import pygame
+from math import isqrt
+from grid import GRID_SIZE
+
+BACKGROUND_COLOR = (0, 0, 0)
+NUMBER_COLOR = (0, 200, 255)
+CORRECT_COLOR = (0, 255, 0)
+INCORRECT_COLOR = (255, 0, 0)
+SELECTED_COLOR = (0, 255, 0)
+LINE_COLOR = (0, 50, 0)
+BOX_LINE_COLOR = (255, 200, 0)
+STATS_INTERVAL = 5.0
+BOARD_PIXELS = 585
+BOARD_HEIGHT = 600
+
+
+def create_line_coordinates(cell_size, size=GRID_SIZE):
+    box = isqrt(size)
+    points=[]
+    for y in range(1,size):
+        points.append(((0, y*cell_size), (size*cell_size, y*cell_size), y % box == 0))
+
+    for x in range(1,size+1):
+        points.append(((x*cell_size,0), (x*cell_size,BOARD_HEIGHT), x % box == 0 and x < size))
+
+    return points
+
+
+class GridView:
+    def __init__(self, font, size=GRID_SIZE):
+        self.size = size
+        self.cell_size = BOARD_PIXELS // size
+        self.line_coordinates = create_line_coordinates(self.cell_size, size)
+        self.font = font
+
+    def cell_at(self, pos):
+        return pos[0] // self.cell_size, pos[1] // self.cell_size
+
+    def cell_rect(self, x, y):
+        return pygame.Rect(x * self.cell_size, y * self.cell_size, self.cell_size, self.cell_size)
+
+    def draw_lines(self, surface):
+        for start, end, box_line in self.line_coordinates:
+            pygame.draw.line(surface, BOX_LINE_COLOR if box_line else LINE_COLOR, start, end)
+
+    def draw_numbers(self, surface, grid):
+        for y in range(grid.size):
+            for x in range(grid.size):
+                if grid.get_cell(x,y) != 0:
+                    color = CORRECT_COLOR if (x,y) in grid.correct_cells else NUMBER_COLOR
+                    text_surface = self.font.render(str(grid.get_cell(x,y)), False, color)
+                    surface.blit(text_surface, text_surface.get_rect(center=self.cell_rect(x, y).center))
+
+    def draw_all(self, surface, grid):
+        self.draw_lines(surface)
+        self.draw_numbers(surface, grid)
+
+
+class GlyphCache:
+    def __init__(self, font):
+        self.font = font
+        self.glyphs = {}
+
+    def get(self, value, color):
+        glyph = self.glyphs.get((value, color))
+        if glyph is None:
+            glyph = self.glyphs[(value, color)] = self.font.render(str(value), False, color)
+        return glyph
+
+
+class FrameStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.frames = 0
+        self.drawn = 0
+        self.render_time = 0.0
+        self.max_render_time = 0.0
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+
+    def record(self, elapsed, drawn):
+        self.frames += 1
+        self.drawn += drawn
+        self.render_time += elapsed
+        self.max_render_time = max(self.max_render_time, elapsed)
+
+    def report(self):
+        wall = time.perf_counter() - self.wall_start
+        cpu = time.process_time() - self.cpu_start
+        frames = max(self.frames, 1)
+        return (f"{self.frames / wall:.0f} fps, {self.drawn} redraws, "
+                f"render {self.render_time / frames * 1000:.2f} ms avg / {self.max_render_time * 1000:.2f} ms max, "
+                f"cpu {cpu / wall:.0%}")
+
+
+class Renderer:
+    def __init__(self, client, fps=60, show_stats=False):
+        self.client = client
+        self.surface = client.surface
+        self.fps = fps
+        self.show_stats = show_stats
+        self.clock = pygame.time.Clock()
+        self.view = client.view
+        self.glyphs = GlyphCache(self.view.font)
+        self.stats = FrameStats()
+        self.total = FrameStats()
+        self.static_layer = None
+        self.cells = {}
+        self.panel_state = None
+        self.result_rect = None
+        self.changed = True
+        self.full_redraw = True
+
+    def mark_changed(self):
+        self.changed = True
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def build_static_layer(self):
+        layer = pygame.Surface(self.surface.get_size())
+        layer.fill(BACKGROUND_COLOR)
+        self.view.draw_lines(layer)
+        return layer
+
+    def panel_rect(self):
+        client = self.client
+        return pygame.Rect(client.score_x, 0, client.window_width - client.score_x, client.window_height)
+
+    def cell_state(self, grid, x, y, incorrect_moves, selected_cell):
+        value = grid.get_cell(x, y)
+        if value:
+            color = CORRECT_COLOR if (x, y) in grid.correct_cells else NUMBER_COLOR
+        elif (x, y) in incorrect_moves:
+            value, color = incorrect_moves[(x, y)], INCORRECT_COLOR
+        else:
+            color = None
+        return value, color, selected_cell == (x, y)
+
+    def draw_cell(self, x, y, state):
+        value, color, selected = state
+        rect = self.view.cell_rect(x, y)
+        self.surface.blit(self.static_layer, rect, rect)
+        if color is not None:
+            glyph = self.glyphs.get(value, color)
+            self.surface.blit(glyph, glyph.get_rect(center=rect.center))
+        if selected:
+            pygame.draw.rect(self.surface, SELECTED_COLOR, rect, 3)
+        return rect
+
+    def render(self, incorrect_moves, game_ended):
+        start = time.perf_counter()
+        client = self.client
+        grid = client.grid
+        dirty = []
+
+        if self.static_layer is None:
+            self.static_layer = self.build_static_layer()
+        if self.full_redraw:
+            self.surface.blit(self.static_layer, (0, 0))
+            self.cells = {}
+            self.panel_state = None
+            self.result_rect = None
+            self.changed = True
+
+        if self.changed:
+            selected_cell = None if game_ended else client.selected_cell
+            for y in range(grid.size):
+                for x in range(grid.size):
+                    state = self.cell_state(grid, x, y, incorrect_moves, selected_cell)
+                    if self.cells.get((x, y)) != state:
+                        self.cells[(x, y)] = state
+                        dirty.append(self.draw_cell(x, y, state))
+
+            panel_state = (tuple(sorted(client.scores.items())), client.current_turn, client.player_number)
+            if panel_state != self.panel_state:
+                self.panel_state = panel_state
+                rect = self.panel_rect()
+                self.surface.blit(self.static_layer, rect, rect)
+                client.draw_score_table()
+                client.draw_player_indicator()
+                dirty.append(rect)
+
+            if game_ended and (self.result_rect is None or dirty):
+                self.result_rect = client.draw_game_result()
+                dirty.append(self.result_rect)
+
+        if self.full_redraw:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
+        self.full_redraw = False
+        self.changed = False
+
+        self.stats.record(time.perf_counter() - start, len(dirty))
+        self.total.record(time.perf_counter() - start, len(dirty))
+        if self.show_stats and time.perf_counter() - self.stats.wall_start >= STATS_INTERVAL:
+            print(f"Frames: {self.stats.report()}")
+            self.stats.reset()
+        self.clock.tick(self.fps)
@@ -0,0 +1,290 @@
+import argparse
+import bisect
+import gzip
+import os
+import struct
+import time
+import zlib
+from grid import Grid
+import protocol
+from journal import encode_puzzle, decode_puzzle, PUZZLE
+
+FRAME = struct.Struct('!BHII')
+START = struct.Struct('!QIii')
+MOVE = struct.Struct('!BBBBB')
+END = struct.Struct('!iiB')
+START_EVENT, MOVE_EVENT, END_EVENT = range(3)
+
+SUFFIX = '.replay.gz'
+COMPRESS_LEVEL = 6
+CHUNK_SIZE = 1 << 16
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+SOLVE_BUCKETS = (10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+SUSPECT_MOVES = 20
+SUSPECT_ERROR_RATE = 0.5
+SUSPECT_EXAMPLES = 20
+
+
+class ReplayWriter:
+    def __init__(self, directory, name='server'):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}-{os.getpid()}{SUFFIX}')
+        self.file = gzip.open(self.path, 'ab', compresslevel=COMPRESS_LEVEL)
+        self.started = {}
+        self.events = 0
+        self.dirty = False
+
+    def write(self, kind, match_id, body):
+        started = self.started.get(match_id)
+        elapsed = 0 if started is None else int((time.monotonic() - started) * 1000)
+        self.file.write(FRAME.pack(kind, len(body), match_id, elapsed) + body)
+        self.events += 1
+        self.dirty = True
+
+    def start(self, room):
+        self.started[room.match_id] = time.monotonic()
+        body = START.pack(int(time.time() * 1000), room.seq, room.scores[0], room.scores[1]) + encode_puzzle(room.puzzle)
+        if room.seq:
+            body += protocol.pack_board(room.grid.get_board())
+        self.write(START_EVENT, room.match_id, body)
+
+    def move(self, room, player_number, x, y, value, correct):
+        self.write(MOVE_EVENT, room.match_id, MOVE.pack(player_number, x, y, value, correct))
+
+    def end(self, room, completed):
+        self.write(END_EVENT, room.match_id, END.pack(room.scores[0], room.scores[1], completed))
+        self.started.pop(room.match_id, None)
+
+    def flush(self):
+        if self.dirty and not self.file.closed:
+            self.file.flush(zlib.Z_SYNC_FLUSH)
+            self.dirty = False
+
+    def stats(self):
+        return {'path': self.path, 'events': self.events, 'open_matches': len(self.started)}
+
+    def close(self):
+        self.file.close()
+
+
+def decode_start(body):
+    _, seq, score_0, score_1 = START.unpack_from(body)
+    size = body[START.size]
+    puzzle_end = START.size + PUZZLE.size + 2 * protocol.board_bytes(size)
+    puzzle = decode_puzzle(body[START.size:puzzle_end])
+    board = protocol.unpack_board(body[puzzle_end:], size) if seq else puzzle.board
+    return puzzle, board, seq, {0: score_0, 1: score_1}
+
+
+def replay_paths(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(SUFFIX):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def decompressed_chunks(path, chunk_size=CHUNK_SIZE):
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return
+            while data:
+                yield decompressor.decompress(data)
+                data = b''
+                if decompressor.eof:
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(GZIP_WBITS)
+
+
+def read_frames(path, chunk_size=CHUNK_SIZE):
+    buffer = b''
+    for chunk in decompressed_chunks(path, chunk_size):
+        buffer += chunk
+        offset = 0
+        while offset + FRAME.size <= len(buffer):
+            kind, length, match_id, elapsed = FRAME.unpack_from(buffer, offset)
+            end = offset + FRAME.size + length
+            if end > len(buffer):
+                break
+            yield kind, match_id, elapsed, buffer[offset + FRAME.size:end]
+            offset = end
+        buffer = buffer[offset:]
+
+
+def read_events(paths):
+    for path in replay_paths(paths):
+        for frame in read_frames(path):
+            yield (path,) + frame
+
+
+def replay_match(path, match_id):
+    grid = None
+    moves = []
+    scores = {0: 0, 1: 0}
+    partial = False
+    for kind, frame_match, elapsed, body in read_frames(path):
+        if frame_match != match_id:
+            continue
+        if kind == START_EVENT:
+            puzzle, board, seq, scores = decode_start(body)
+            grid = Grid(board, puzzle.solution)
+            moves = []
+            partial = seq > 0
+        elif kind == MOVE_EVENT and grid is not None:
+            player_number, x, y, value, correct = MOVE.unpack(body)
+            if correct:
+                grid.set_cell(x, y, value)
+                grid.correct_cells.add((x, y))
+            scores[player_number] += 1 if correct else -1
+            moves.append((elapsed, player_number, x, y, value, bool(correct)))
+        elif kind == END_EVENT and grid is not None:
+            break
+    return grid, moves, scores, partial
+
+
+class MatchTally:
+    __slots__ = ('group', 'partial', 'moves', 'errors', 'players')
+
+    def __init__(self, group, partial):
+        self.group = group
+        self.partial = partial
+        self.moves = 0
+        self.errors = 0
+        self.players = [[0, 0], [0, 0]]
+
+
+class GroupTally:
+    def __init__(self):
+        self.matches = 0
+        self.completed = 0
+        self.moves = 0
+        self.errors = 0
+        self.play_time = 0.0
+        self.solve_time = 0.0
+        self.solve_counts = [0] * (len(SOLVE_BUCKETS) + 1)
+
+    def solve_percentile(self, fraction):
+        total = sum(self.solve_counts)
+        if not total:
+            return None
+        seen = 0
+        for bound, count in zip(SOLVE_BUCKETS + (float('inf'),), self.solve_counts):
+            seen += count
+            if seen >= fraction * total:
+                return bound
+        return None
+
+
+class Aggregates:
+    def __init__(self):
+        self.open = {}
+        self.groups = {}
+        self.events = 0
+        self.unfinished = 0
+        self.suspects = 0
+        self.examples = []
+
+    def feed(self, path, kind, match_id, elapsed, body):
+        self.events += 1
+        key = (path, match_id)
+        if kind == START_EVENT:
+            puzzle, _, seq, _ = decode_start(body)
+            self.open[key] = MatchTally((puzzle.size, puzzle.difficulty or 'any'), seq > 0)
+            return
+        match = self.open.get(key)
+        if match is None:
+            return
+        if kind == MOVE_EVENT:
+            player_number, _, _, _, correct = MOVE.unpack(body)
+            match.moves += 1
+            match.errors += not correct
+            match.players[player_number][0] += 1
+            match.players[player_number][1] += not correct
+        elif kind == END_EVENT:
+            del self.open[key]
+            self.finish(key, match, END.unpack(body)[2], elapsed)
+
+    def finish(self, key, match, completed, elapsed):
+        group = self.groups.get(match.group)
+        if group is None:
+            group = self.groups[match.group] = GroupTally()
+        group.matches += 1
+        group.moves += match.moves
+        group.errors += match.errors
+        group.play_time += elapsed / 1000
+        if completed and not match.partial:
+            group.completed += 1
+            group.solve_time += elapsed / 1000
+            group.solve_counts[bisect.bisect_left(SOLVE_BUCKETS, elapsed / 1000)] += 1
+        self.check_players(key, match)
+
+    def check_players(self, key, match):
+        for player_number, (moves, errors) in enumerate(match.players):
+            if moves >= SUSPECT_MOVES and errors / moves >= SUSPECT_ERROR_RATE:
+                self.suspects += 1
+                if len(self.examples) < SUSPECT_EXAMPLES:
+                    self.examples.append((key, player_number, moves, errors))
+
+    def close(self):
+        for key, match in self.open.items():
+            self.check_players(key, match)
+        self.unfinished = len(self.open)
+        self.open = {}
+
+
+def stats(paths):
+    aggregates = Aggregates()
+    start = time.perf_counter()
+    for event in read_events(paths):
+        aggregates.feed(*event)
+    aggregates.close()
+    return aggregates, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Read match replays recorded with server-sudoku.py --replay-dir')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    stats_parser = commands.add_parser('stats', help='aggregate solve times, error rates and move rates')
+    stats_parser.add_argument('paths', nargs='+', help='replay files or directories holding them')
+
+    show_parser = commands.add_parser('show', help='replay one match into a grid')
+    show_parser.add_argument('path')
+    show_parser.add_argument('match_id', type=int)
+    show_parser.add_argument('--moves', action='store_true', help='list every move')
+
+    args = parser.parse_args()
+    if args.command == 'stats':
+        aggregates, elapsed = stats(args.paths)
+        print(f"{aggregates.events} events in {elapsed:.2f}s ({aggregates.events / max(elapsed, 1e-9):.0f}/s), "
+              f"{aggregates.unfinished} matches without an end")
+        print(f"{'board':<7}{'tier':<8}{'matches':>8}{'solved':>8}{'solve avg':>11}{'solve p50':>11}"
+              f"{'error rate':>12}{'moves/s':>9}")
+        for (size, tier), group in sorted(aggregates.groups.items()):
+            solve_avg = f"{group.solve_time / group.completed:.0f}s" if group.completed else '-'
+            p50 = group.solve_percentile(0.5)
+            p50 = '-' if p50 is None else f"<={p50}s" if p50 != float('inf') else f">{SOLVE_BUCKETS[-1]}s"
+            error_rate = group.errors / group.moves if group.moves else 0.0
+            move_rate = group.moves / group.play_time if group.play_time else 0.0
+            print(f"{size}x{size:<4}{tier:<8}{group.matches:>8}{group.completed:>8}{solve_avg:>11}{p50:>11}"
+                  f"{error_rate:>12.1%}{move_rate:>9.2f}")
+        print(f"{aggregates.suspects} players with an error rate of {SUSPECT_ERROR_RATE:.0%} or more "
+              f"over at least {SUSPECT_MOVES} moves")
+        for (path, match_id), player_number, moves, errors in aggregates.examples:
+            print(f"  {os.path.basename(path)} match {match_id} player {player_number}: {errors}/{moves} wrong")
+    else:
+        grid, moves, scores, partial = replay_match(args.path, args.match_id)
+        if grid is None:
+            raise SystemExit(f"No match {args.match_id} in {args.path}")
+        if args.moves:
+            for elapsed, player_number, x, y, value, correct in moves:
+                print(f"{elapsed / 1000:8.2f}s  player {player_number}  ({x}, {y}) = {value}  "
+                      f"{'correct' if correct else 'wrong'}")
+        grid.show()
+        print(f"{len(moves)} moves, scores {scores}, {'complete' if grid.is_complete() else 'incomplete'}"
+              f"{' (recording started mid-match)' if partial else ''}")
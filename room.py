@@ -0,0 +1,78 @@
+from grid import Grid
+
+MAX_PLAYERS = 2
+
+
+class Room:
+    def __init__(self, match_id, puzzle):
+        self.match_id = match_id
+        self.puzzle = puzzle
+        self.grid = Grid(puzzle.board, puzzle.solution)
+        self.clients = {}
+        self.current_turn = 0
+        self.scores = {0: 0, 1: 0}
+        self.correct_cells = set()
+        self.turn_timer = None
+        self.seq = 0
+        self.tokens = {}
+        self.spectators = set()
+
+    def is_full(self):
+        return len(self.clients) >= MAX_PLAYERS
+
+    def is_empty(self):
+        return len(self.clients) == 0
+
+    def seat_of(self, token):
+        for player_number, seat_token in self.tokens.items():
+            if seat_token == token:
+                return player_number
+        return None
+
+    def free_seat(self, token=None):
+        if token is not None:
+            player_number = self.seat_of(token)
+            if player_number is not None:
+                return player_number
+        taken = set(self.clients.values())
+        return next((p for p in range(MAX_PLAYERS) if p not in taken and p not in self.tokens), None)
+
+    def player_addr(self, player_number):
+        for addr, seat in self.clients.items():
+            if seat == player_number:
+                return addr
+        return None
+
+    def occupy(self, player_number, token=None):
+        resumed = token is not None and self.tokens.get(player_number) == token
+        if not resumed:
+            self.scores[player_number] = 0
+        if token is not None:
+            self.tokens[player_number] = token
+        else:
+            self.tokens.pop(player_number, None)
+        return resumed
+
+    def add_player(self, addr, token=None):
+        player_number = self.free_seat(token)
+        resumed = self.occupy(player_number, token)
+        self.clients[addr] = player_number
+        if len(self.clients) == 1 and not resumed:
+            self.current_turn = player_number
+        return player_number
+
+    def remove_player(self, addr):
+        player_number = self.clients.pop(addr, None)
+        if player_number is not None:
+            self.tokens.pop(player_number, None)
+        return player_number
+
+    def next_seq(self):
+        self.seq += 1
+        return self.seq
+
+    def next_turn(self):
+        return (self.current_turn + 1) % MAX_PLAYERS
+
+    def is_game_complete(self):
+        return self.grid.is_complete()
@@ -1,270 +1,800 @@
 import socket
-import pickle
-from grid import Grid
-import pygame
+import protocol
+import argparse
+import asyncio
+from itertools import count
+from room import Room
+from generator import DIFFICULTIES, GenerationError, check_target
+from grid import GRID_SIZE, SUB_GRID_SIZE
+from math import isqrt
+from pool import PuzzlePool
+from bank import PuzzleBank
+from timers import TimerQueue, Liveness
+from reliable import ReliableEndpoint, KIND, UNRELIABLE
+from metrics import Metrics, MetricsServer, Profiler
+from shard import Dispatcher, CONTROL, ROUTE, pack_route, unpack_route
+from journal import (Journal, recover, snapshot_frames, room_frame, seat_frame, move_frame, leave_frame,
+                     close_frame)
+from replay import ReplayWriter
+import multiprocessing
+import json
+import os
 import signal
+import struct
 import sys
+import time
+import traceback
+
+TURN_TIMEOUT = 60.0
+PING_INTERVAL = 5.0
+IDLE_TIMEOUT = 15.0
+EVICT_INTERVAL = 1.0
+MAX_SPECTATORS = 1000
+FANOUT_BATCH = 256
+SPECTATOR_PREFIX = KIND.pack(UNRELIABLE)
+MAX_DATAGRAM = 65535
+RETRANSMIT_INTERVAL = 0.05
+STATS_INTERVAL = 1.0
+SNAPSHOT_INTERVAL = 30.0
+RESUME_TIMEOUT = 120.0
+POOL_SIZE = 16
+REPLAY_FLUSH_INTERVAL = 1.0
+
+
+class SudokuProtocol(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def connection_made(self, transport):
+        self.server.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.server.datagram_received(data, addr)
+
+    def error_received(self, exc):
+        print(f"Error in server: {exc}")
+
 
 class SudokuServer:
-    def __init__(self, host='0.0.0.0', port=5555):
-        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server.bind((host, port))
-        
-        pygame.font.init()
-        self.game_font = pygame.font.SysFont('Arial', 50)
-        self.clients = {}
-        self.reset_game_state()
-        print(f"Server started on {host}:{port}")
-
-    def reset_game_state(self):
-        self.grid = Grid(self.game_font)
-        self.grid.remove_numbers(10)
-        self.clients = {}
-        self.current_turn = 0
-        self.scores = {0: 0, 1: 0}
-        self.correct_cells = set()
-        print("Game state reset - Ready for new players")
-
-    def is_game_complete(self):
-        if not self.grid:
-            return False
-        for y in range(9):
-            for x in range(9):
-                if self.grid.get_cell(x, y) == 0:
-                    return False
-        return True
-
-    def handle_client(self, client_socket, addr):
-        try:
-            player_number = len(self.clients)
-            init_data = {
-                'board': self.grid.get_board(),
+    def __init__(self, host='0.0.0.0', port=5555, engine='asyncio', difficulty=None, clues=None,
+                 pool_size=None, pool_workers=1, pool_processes=True, bank_path=None,
+                 metrics_addr=None, profile_path=None, shard=0, shards=1, upstream=None, state_dir=None,
+                 idle_timeout=IDLE_TIMEOUT, turn_timeout=TURN_TIMEOUT, send_seeds=False,
+                 sizes=(GRID_SIZE,), replay_dir=None):
+        self.host = host
+        self.port = port
+        self.engine = engine
+        self.shard = shard
+        self.shards = shards
+        self.upstream = upstream
+        self.stop_signal = signal.SIGINT
+        if upstream is not None:
+            self.host, self.port = '127.0.0.1', 0
+        self.difficulty = difficulty
+        self.bank = PuzzleBank(bank_path) if bank_path else None
+        self.sizes = sizes
+        pool_sizes = {SUB_GRID_SIZE: 0} if self.bank is not None and pool_size is None else {}
+        self.pool = PuzzlePool((difficulty,), POOL_SIZE if pool_size is None else pool_size, clues=clues,
+                               workers=pool_workers, processes=pool_processes,
+                               sub_grids=[isqrt(size) for size in sizes], sizes=pool_sizes)
+        self.server = None
+        self.transport = None
+        self.loop = None
+        self.timers = TimerQueue()
+        self.outbox = []
+        self.encoded = {}
+        self.link = ReliableEndpoint(self.sendto)
+        self.retransmit_timer = None
+        self.periodic = {}
+        self.closed = False
+        self.liveness = Liveness(idle_timeout)
+        self.turn_timeout_delay = turn_timeout
+        self.send_seeds = send_seeds
+        if engine == 'sync':
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.server.bind((self.host, self.port))
+
+        self.rooms = {}
+        self.client_rooms = {}
+        self.spectating = {}
+        self.open_rooms = {}
+        self.match_ids = count(shard + 1, shards)
+        self.sessions = {}
+        self.journal = None
+        self.replays = None
+        if replay_dir is not None:
+            self.replays = ReplayWriter(replay_dir, 'server' if upstream is None else f'worker-{shard}')
+        if state_dir is not None:
+            self.restore(state_dir)
+        self.setup_metrics()
+        self.metrics_server = MetricsServer(self.metrics, *metrics_addr) if metrics_addr else None
+        self.profiler = Profiler(profile_path)
+        if upstream is None:
+            print(f"Server started on {host}:{port} ({engine} engine)")
+        else:
+            print(f"Worker {shard} started (pid {os.getpid()}, {engine} engine)")
+
+    def setup_metrics(self):
+        self.metrics = Metrics()
+        self.received = self.metrics.counter('messages_received_total', 'Messages received by type', 'type')
+        self.sent = self.metrics.counter('messages_sent_total', 'Messages sent by type', 'type')
+        self.errors = self.metrics.counter('errors_total', 'Datagrams or messages dropped by reason', 'reason')
+        self.fanout = self.metrics.counter('spectator_packets_total', 'Datagrams sent to spectators')
+        self.evictions = self.metrics.counter('evictions_total', 'Peers dropped by reason', 'reason')
+        self.handle_time = self.metrics.histogram('handle_seconds', 'Time to decode and handle a message', 'type')
+        self.decode_time = self.metrics.histogram('decode_seconds', 'Time to decode a message')
+        self.encode_time = self.metrics.histogram('encode_seconds', 'Time to encode a message', 'type')
+        self.move_time = self.metrics.histogram('move_seconds', 'Time to apply a move and fan out the result')
+        self.broadcast_time = self.metrics.histogram('broadcast_seconds', 'Time to send a message to a room')
+        self.sendto_time = self.metrics.histogram('sendto_seconds', 'Time spent in socket sendto calls')
+        self.puzzle_time = self.metrics.histogram('puzzle_seconds', 'Time to get a puzzle for a new room', 'source')
+        self.metrics.collect('rooms', 'Active rooms', lambda: len(self.rooms))
+        self.metrics.collect('open_rooms', 'Rooms waiting for a player', lambda: len(self.open_rooms))
+        self.metrics.collect('players', 'Connected players', lambda: len(self.client_rooms))
+        self.metrics.collect('spectators', 'Connected spectators', lambda: len(self.spectating))
+        self.metrics.collect('peers', 'Addresses with reliable channel state', lambda: len(self.link.channels))
+        self.metrics.collect('live_peers', 'Addresses heard from within the idle timeout', lambda: len(self.liveness))
+        self.metrics.collect('pool_hits_total', 'Puzzles served from the pool',
+                             lambda: self.pool.hits, 'counter')
+        self.metrics.collect('pool_misses_total', 'Puzzles generated on demand after a pool miss',
+                             lambda: self.pool.misses, 'counter')
+        self.metrics.collect('pool_failures_total', 'Background puzzle generations that raised',
+                             lambda: self.pool.failures, 'counter')
+        self.metrics.collect('journal_records_total', 'Records written to the move journal',
+                             lambda: self.journal.records if self.journal is not None else 0, 'counter')
+        self.metrics.collect('journal_fsyncs_total', 'Batched journal fsyncs',
+                             lambda: self.journal.fsyncs if self.journal is not None else 0, 'counter')
+        self.metrics.collect('replay_events_total', 'Events written to the replay log',
+                             lambda: self.replays.events if self.replays is not None else 0, 'counter')
+        self.metrics.collect('pool_ready', 'Puzzles ready in the pool',
+                             lambda: sum(self.pool.stats()['ready'].values()))
+
+    def restore(self, state_dir):
+        start = time.perf_counter()
+        generation, rooms, replayed = recover(state_dir)
+        self.journal = Journal(state_dir, generation)
+        for room in rooms.values():
+            self.rooms[room.match_id] = room
+            for token in room.tokens.values():
+                self.sessions[token] = room
+            if self.replays is not None:
+                self.replays.start(room)
+        if rooms:
+            next_id = max(rooms) + 1
+            next_id += (self.shard - (next_id - 1)) % self.shards
+            self.match_ids = count(next_id, self.shards)
+        print(f"Recovered {len(rooms)} rooms from {state_dir} (snapshot {generation}, "
+              f"{replayed} journal records) in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    def start_persistence(self):
+        if self.replays is not None:
+            self.schedule_replay_flush()
+        if self.journal is None:
+            return
+        for room in self.rooms.values():
+            self.call_later(RESUME_TIMEOUT, self.release_reservations, room)
+        self.schedule_snapshot()
+
+    def take_snapshot(self):
+        self.journal.snapshot([frame for room in self.rooms.values() for frame in snapshot_frames(room)])
+
+    def schedule_snapshot(self):
+        self.take_snapshot()
+        self.repeat(SNAPSHOT_INTERVAL, self.schedule_snapshot)
+
+    def schedule_replay_flush(self):
+        self.replays.flush()
+        self.repeat(REPLAY_FLUSH_INTERVAL, self.schedule_replay_flush)
+
+    def release_reservations(self, room, token=None):
+        if self.rooms.get(room.match_id) is not room:
+            return
+        present = set(room.clients.values())
+        for player_number, seat_token in list(room.tokens.items()):
+            if player_number not in present and token in (None, seat_token):
+                del room.tokens[player_number]
+                self.sessions.pop(seat_token, None)
+                if self.journal is not None:
+                    self.journal.append(leave_frame(room, player_number))
+        if room.is_empty():
+            self.close_room(room)
+        elif not room.is_full():
+            self.open_rooms[room.match_id] = room
+
+    def call_later(self, delay, callback, *args):
+        if self.loop is not None:
+            return self.loop.call_later(delay, callback, *args)
+        return self.timers.call_later(delay, callback, *args)
+
+    def repeat(self, delay, callback):
+        self.periodic[callback.__name__] = self.call_later(delay, callback)
+
+    def cancel_timers(self):
+        for handle in self.periodic.values():
+            handle.cancel()
+        self.periodic.clear()
+        if self.retransmit_timer is not None:
+            self.retransmit_timer.cancel()
+            self.retransmit_timer = None
+        for room in self.rooms.values():
+            if room.turn_timer is not None:
+                room.turn_timer.cancel()
+                room.turn_timer = None
+
+    def write(self, packet, addr):
+        if self.closed:
+            return
+        if self.transport is not None:
+            self.transport.sendto(packet, addr)
+        else:
+            self.server.sendto(packet, addr)
+
+    def sendto(self, packet, addr):
+        start = time.perf_counter()
+        if self.upstream is not None:
+            packet, addr = pack_route(addr) + packet, self.upstream
+        self.write(packet, addr)
+        self.sendto_time.observe(time.perf_counter() - start)
+
+    def datagram_received(self, data, addr):
+        if self.upstream is not None:
+            if len(data) < ROUTE.size:
+                self.errors.inc('malformed')
+                return
+            data, addr = data[ROUTE.size:], unpack_route(data)
+        self.handle_datagram(data, addr)
+
+    def report_stats(self):
+        stats = {
+            'worker': self.shard,
+            'pid': os.getpid(),
+            'rooms': len(self.rooms),
+            'players': len(self.client_rooms),
+            'received': sum(self.received.values.values()),
+            'moves': self.received.values.get('move', 0),
+            'errors': sum(self.errors.values.values())
+        }
+        self.write(CONTROL + json.dumps(stats).encode(), self.upstream)
+
+    def schedule_stats(self):
+        self.report_stats()
+        self.repeat(STATS_INTERVAL, self.schedule_stats)
+
+    def encode(self, message):
+        start = time.perf_counter()
+        data = protocol.encode(message)
+        self.encode_time.observe(time.perf_counter() - start, message['type'])
+        return data
+
+    def send(self, message, addr):
+        reliable = message['type'] in protocol.RELIABLE_TYPES
+        self.sent.inc(message['type'])
+        if self.transport is None:
+            self.link.send(self.encode(message), addr, reliable)
+        else:
+            if not self.outbox:
+                self.loop.call_soon(self.flush_outbox)
+            cached = self.encoded.get(id(message))
+            if cached is None:
+                cached = self.encoded[id(message)] = (message, self.encode(message))
+            self.outbox.append((cached[1], addr, reliable))
+        if reliable and self.retransmit_timer is None:
+            self.schedule_retransmit()
+
+    def flush_outbox(self):
+        outbox, self.outbox = self.outbox, []
+        self.encoded.clear()
+        for data, addr, reliable in outbox:
+            self.link.send(data, addr, reliable)
+
+    def schedule_retransmit(self):
+        delay = self.link.next_delay()
+        if delay is None:
+            self.retransmit_timer = None
+        else:
+            self.retransmit_timer = self.call_later(min(delay, RETRANSMIT_INTERVAL), self.retransmit)
+
+    def retransmit(self):
+        for addr in self.link.poll():
+            print(f"Lost contact with {addr}")
+            self.evictions.inc('unacked')
+            self.handle_disconnect(addr)
+        self.schedule_retransmit()
+
+    def broadcast(self, room, message, exclude=None):
+        start = time.perf_counter()
+        for client_addr in room.clients:
+            if client_addr != exclude:
+                self.send(message, client_addr)
+        if room.spectators:
+            self.call_later(0, self.send_batch, SPECTATOR_PREFIX + self.encode(message), list(room.spectators))
+        self.broadcast_time.observe(time.perf_counter() - start)
+
+    def send_batch(self, packet, addrs, start=0):
+        end = start + FANOUT_BATCH
+        for addr in addrs[start:end]:
+            self.sendto(packet, addr)
+        self.fanout.inc(amount=len(addrs[start:end]))
+        if end < len(addrs):
+            self.call_later(0, self.send_batch, packet, addrs, end)
+
+    def create_room(self, match_id=None, size=GRID_SIZE):
+        if match_id is None:
+            match_id = next(self.match_ids)
+            while match_id in self.rooms:
+                match_id = next(self.match_ids)
+        start = time.perf_counter()
+        puzzle = self.bank.sample(self.difficulty) if self.bank is not None and size == GRID_SIZE else None
+        source = 'bank'
+        if puzzle is None:
+            puzzle = self.pool.get(self.difficulty, isqrt(size))
+            source = 'pool'
+        self.puzzle_time.observe(time.perf_counter() - start, source)
+        room = Room(match_id, puzzle)
+        self.rooms[match_id] = room
+        self.open_rooms[match_id] = room
+        if self.journal is not None:
+            self.journal.append(room_frame(room))
+        if self.replays is not None:
+            self.replays.start(room)
+        print(f"Room {match_id} created with {size}x{size} {puzzle.difficulty} puzzle {puzzle.seed or 0:016x} "
+              f"({puzzle.clues} clues, ready in {(time.perf_counter() - start) * 1000:.1f} ms) - Ready for new players")
+        return room
+
+    def close_room(self, room, completed=False):
+        if room.turn_timer is not None:
+            room.turn_timer.cancel()
+            room.turn_timer = None
+        for client_addr in room.clients:
+            self.client_rooms.pop(client_addr, None)
+        for token in room.tokens.values():
+            self.sessions.pop(token, None)
+        for spectator_addr in room.spectators:
+            self.spectating.pop(spectator_addr, None)
+        room.spectators.clear()
+        room.clients.clear()
+        self.rooms.pop(room.match_id, None)
+        self.open_rooms.pop(room.match_id, None)
+        if self.journal is not None:
+            self.journal.append(close_frame(room))
+        if self.replays is not None:
+            self.replays.end(room, completed)
+        print(f"Room {room.match_id} closed")
+
+    def find_room(self, match_id=None, token=None, size=GRID_SIZE):
+        if match_id is not None:
+            room = self.rooms.get(match_id)
+            if room is None:
+                return self.create_room(match_id, size)
+            return None if room.free_seat(token) is None else room
+        for room in self.open_rooms.values():
+            if room.grid.size == size:
+                return room
+        return self.create_room(size=size)
+
+    def start_turn(self, room, player_number):
+        room.current_turn = player_number
+        if room.turn_timer is not None:
+            room.turn_timer.cancel()
+            room.turn_timer = None
+        if room.is_full():
+            room.turn_timer = self.call_later(self.turn_timeout_delay, self.turn_timeout, room)
+
+    def turn_timeout(self, room):
+        room.turn_timer = None
+        if room.match_id not in self.rooms:
+            return
+        stalled_player = room.current_turn
+        self.start_turn(room, room.next_turn())
+        pass_delta = {
+            'type': 'delta',
+            'seq': room.next_seq(),
+            'result': 'pass',
+            'player': stalled_player,
+            'current_turn': room.current_turn
+        }
+        self.broadcast(room, pass_delta)
+        if self.journal is not None:
+            self.journal.append(move_frame(room, pass_delta))
+
+    def snapshot(self, room):
+        return {
+            'type': 'update',
+            'seq': room.seq,
+            'board': room.grid.get_board(),
+            'current_turn': room.current_turn,
+            'scores': room.scores,
+            'correct_cells': room.correct_cells
+        }
+
+    def init_message(self, room, player_number):
+        puzzle = room.puzzle
+        if self.send_seeds and room.seq == 0 and puzzle.seed is not None:
+            return {
+                'type': 'start',
+                'match_id': room.match_id,
                 'player_number': player_number,
-                'current_turn': self.current_turn,
-                'scores': self.scores,
-                'correct_cells': self.correct_cells
+                'current_turn': room.current_turn,
+                'seed': puzzle.seed,
+                'difficulty': puzzle.tier,
+                'clues': puzzle.clue_target,
+                'size': puzzle.size
             }
-            client_socket.send(pickle.dumps(init_data))
-            self.clients.append(client_socket)
-            
-            while True:
-                try:
-                    data = client_socket.recv(1024)
-                    if not data:
-                        break
-                    
-                    move_data = pickle.loads(data)
-                    if player_number == self.current_turn:
-                        x, y, value = move_data['x'], move_data['y'], move_data['value']
-                        if self.grid.solution[y][x] == value:
-            
-                            self.grid.set_cell(x, y, value)
-                            self.scores[player_number] += 1
-                            self.correct_cells.add((x, y))
-                            
-          
-                            if self.is_game_complete():
-                                game_end_data = {
-                                    'type': 'game_end',
-                                    'board': self.grid.get_board(),
-                                    'scores': self.scores,
-                                    'correct_cells': self.correct_cells
-                                }
-   
-                                for client in self.clients:
-                                    client.send(pickle.dumps(game_end_data))
-
-                                self.reset_game_state()
-                            else:
-                                update_data = {
-                                    'type': 'update',
-                                    'board': self.grid.get_board(),
-                                    'current_turn': (self.current_turn + 1) % 2,
-                                    'scores': self.scores,
-                                    'correct_cells': self.correct_cells
-                                }
-                                for client in self.clients:
-                                    if client != client_socket:
-                                        client.send(pickle.dumps(update_data))
-                                self.current_turn = (self.current_turn + 1) % 2
-                        else:
-                            self.scores[player_number] -= 1
-                            incorrect_update = {
-                                'board': self.grid.get_board(),
-                                'current_turn': (self.current_turn + 1) % 2,
-                                'scores': self.scores,
-                                'correct_cells': self.correct_cells,
-                                'incorrect_move': {
-                                    'x': x,
-                                    'y': y,
-                                    'value': value
-                                }
-                            }
-                            client_socket.send(pickle.dumps(incorrect_update))
-                            other_update = {
-                                'board': self.grid.get_board(),
-                                'current_turn': (self.current_turn + 1) % 2,
-                                'scores': self.scores,
-                                'correct_cells': self.correct_cells
-                            }
-                            for client in self.clients:
-                                if client != client_socket:
-                                    client.send(pickle.dumps(other_update))
-                            self.current_turn = (self.current_turn + 1) % 2
-                    
-                except:
-                    break
-                    
-        except Exception as e:
-            print(f"Error handling client {addr}: {e}")
-        finally:
-            if client_socket in self.clients:
-                self.clients.remove(client_socket)
-            client_socket.close()
-            
-            if len(self.clients) == 0:
-                self.reset_game_state()
+        return dict(self.snapshot(room), type='init', match_id=room.match_id, player_number=player_number)
 
-    def signal_handler(self, sig, frame):
+    def ping_clients(self):
+        ping_data = {'type': 'ping'}
+        for client_addr in self.client_rooms:
+            self.send(ping_data, client_addr)
+        if self.spectating:
+            self.send_batch(SPECTATOR_PREFIX + self.encode(ping_data), list(self.spectating))
+        self.repeat(PING_INTERVAL, self.ping_clients)
+
+    def evict_idle(self):
+        for addr in self.liveness.expired():
+            if addr in self.client_rooms or addr in self.spectating:
+                print(f"Evicting idle player {addr}")
+                self.evictions.inc('idle')
+                self.send({'type': 'disconnect'}, addr)
+            self.handle_disconnect(addr, keep_seat=True)
+        self.repeat(EVICT_INTERVAL, self.evict_idle)
+
+    def handle_join(self, message, addr):
+        token = message.get('token')
+        current_room = self.client_rooms.get(addr)
+        if current_room is not None:
+            if message.get('match_id') in (None, current_room.match_id):
+                return
+            self.handle_disconnect(addr)
+        watched_room = self.spectating.pop(addr, None)
+        if watched_room is not None:
+            watched_room.spectators.discard(addr)
+        self.link.forget(addr)
+
+        size = message.get('size', GRID_SIZE)
+        if size not in self.sizes:
+            print(f"Rejected connection from {addr}: {size}x{size} boards are not enabled")
+            return
+        room = self.sessions.get(token) if token is not None else None
+        if room is None:
+            try:
+                room = self.find_room(message.get('match_id'), token, size)
+            except GenerationError as e:
+                self.errors.inc('no_puzzle')
+                print(f"Rejected connection from {addr}: {e}")
+                return
+            if room is None:
+                print(f"Rejected connection from {addr}: Game full")
+                return
+        else:
+            old_addr = room.player_addr(room.seat_of(token))
+            if old_addr is not None:
+                del room.clients[old_addr]
+                self.client_rooms.pop(old_addr, None)
+                self.link.forget(old_addr)
+
+        player_number = room.add_player(addr, token)
+        self.client_rooms[addr] = room
+        if token is not None:
+            self.sessions[token] = room
+        if self.journal is not None:
+            self.journal.append(seat_frame(room, player_number, token))
+        if room.free_seat() is None:
+            self.open_rooms.pop(room.match_id, None)
+        else:
+            self.open_rooms[room.match_id] = room
+        if room.is_full():
+            self.start_turn(room, room.current_turn)
+
+        self.send(self.init_message(room, player_number), addr)
+        print(f"Player {player_number + 1} connected to room {room.match_id} from {addr}")
+
+    def handle_watch(self, message, addr):
+        if addr in self.client_rooms:
+            return
+        match_id = message.get('match_id')
+        if match_id is not None:
+            room = self.rooms.get(match_id)
+        else:
+            room = next((room for room in self.rooms.values() if room.is_full()), None)
+        if room is None or (addr not in room.spectators and len(room.spectators) >= MAX_SPECTATORS):
+            print(f"Rejected spectator {addr}: no such match or too many spectators")
+            return
+
+        current_room = self.spectating.get(addr)
+        if current_room is not None and current_room is not room:
+            current_room.spectators.discard(addr)
+        if addr not in room.spectators:
+            room.spectators.add(addr)
+            self.spectating[addr] = room
+            print(f"Spectator joined room {room.match_id} from {addr} ({len(room.spectators)} watching)")
+        self.sendto(SPECTATOR_PREFIX + self.encode(self.init_message(room, protocol.SPECTATOR)), addr)
+
+    def handle_disconnect(self, addr, keep_seat=False):
+        self.link.forget(addr)
+        self.liveness.forget(addr)
+        watched_room = self.spectating.pop(addr, None)
+        if watched_room is not None:
+            watched_room.spectators.discard(addr)
+        room = self.client_rooms.pop(addr, None)
+        if room is None:
+            return
+        player_number = room.clients.get(addr)
+        token = room.tokens.get(player_number)
+        if keep_seat and token is not None:
+            del room.clients[addr]
+            self.start_turn(room, room.current_turn)
+            self.call_later(RESUME_TIMEOUT, self.release_reservations, room, token)
+            print(f"Player disconnected from {addr}, seat {player_number + 1} kept for {RESUME_TIMEOUT:.0f}s")
+            return
+        self.sessions.pop(token, None)
+        room.remove_player(addr)
+        if self.journal is not None:
+            self.journal.append(leave_frame(room, player_number))
+        if room.is_empty():
+            self.close_room(room)
+        else:
+            self.open_rooms[room.match_id] = room
+            self.start_turn(room, room.current_turn)
+        print(f"Player disconnected from {addr}")
+
+    def handle_datagram(self, data, addr):
+        self.liveness.touch(addr)
+        try:
+            payloads = self.link.receive(data, addr)
+        except (ValueError, struct.error) as e:
+            self.errors.inc('malformed')
+            print(f"Dropped malformed datagram from {addr}: {e}")
+            return
+        for payload in payloads:
+            start = time.perf_counter()
+            try:
+                message = protocol.decode(payload)
+            except (ValueError, struct.error) as e:
+                self.errors.inc('malformed')
+                print(f"Dropped malformed message from {addr}: {e}")
+                continue
+            self.decode_time.observe(time.perf_counter() - start)
+            self.received.inc(message['type'])
+            try:
+                self.handle_message(message, addr)
+            except Exception:
+                self.errors.inc('exception')
+                print(f"Error handling {message['type']} from {addr}:")
+                traceback.print_exc()
+            self.handle_time.observe(time.perf_counter() - start, message['type'])
+
+    def handle_message(self, message, addr):
+        if message.get('type') == 'join':
+            self.handle_join(message, addr)
+
+        elif message.get('type') == 'move':
+            room = self.client_rooms.get(addr)
+            if room is not None and room.clients[addr] == room.current_turn:
+                start = time.perf_counter()
+                self.handle_move(room, message, addr)
+                self.move_time.observe(time.perf_counter() - start)
+
+        elif message.get('type') == 'sync':
+            room = self.client_rooms.get(addr)
+            if room is not None:
+                self.send(self.snapshot(room), addr)
+            elif addr in self.spectating:
+                self.sendto(SPECTATOR_PREFIX + self.encode(self.snapshot(self.spectating[addr])), addr)
+
+        elif message.get('type') == 'watch':
+            self.handle_watch(message, addr)
+
+        elif message.get('type') == 'disconnect':
+            self.handle_disconnect(addr)
+
+    def shutdown(self):
         print("\nShutting down server...")
-        disconnect_message = {'type': 'disconnect'}
-        for client_addr in self.clients:
-            self.server.sendto(pickle.dumps(disconnect_message), client_addr)
-        self.server.close()
+        self.cancel_timers()
+        self.profiler.stop()
+        if self.journal is not None:
+            self.take_snapshot()
+            self.journal.close()
+            print(f"Saved {len(self.rooms)} rooms for resumption ({self.journal.stats()})")
+        else:
+            disconnect_message = {'type': 'disconnect'}
+            for client_addr in self.client_rooms:
+                self.send(disconnect_message, client_addr)
+            for spectator_addr in self.spectating:
+                self.sendto(SPECTATOR_PREFIX + self.encode(disconnect_message), spectator_addr)
+        if self.replays is not None:
+            self.replays.close()
+            print(f"Replays: {self.replays.stats()}")
+        if self.upstream is not None:
+            self.report_stats()
+        if self.transport is not None:
+            self.flush_outbox()
+            self.transport.close()
+        else:
+            self.server.close()
+        self.closed = True
+        self.pool.close()
+        if self.bank is not None:
+            self.bank.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        print(f"Puzzle pool: {self.pool.stats()}")
+
+    def signal_handler(self, sig, frame):
+        signal.signal(sig, signal.SIG_IGN)
+        self.shutdown()
         sys.exit(0)
-        
+
+    def toggle_profiler(self, sig=None, frame=None):
+        self.profiler.toggle()
+
     def start(self):
-        signal.signal(signal.SIGINT, self.signal_handler)
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+            print(f"Metrics on http://{self.metrics_server.httpd.server_address[0]}:"
+                  f"{self.metrics_server.httpd.server_address[1]}/metrics")
+        if self.engine == 'sync':
+            self.run_sync()
+        else:
+            asyncio.run(self.run_async())
+
+    def run_sync(self):
+        signal.signal(self.stop_signal, self.signal_handler)
+        signal.signal(signal.SIGUSR1, self.toggle_profiler)
         print("Starting server...")
+        self.repeat(PING_INTERVAL, self.ping_clients)
+        self.repeat(EVICT_INTERVAL, self.evict_idle)
+        self.start_persistence()
+        if self.upstream is not None:
+            self.schedule_stats()
         while True:
+            self.server.settimeout(self.timers.next_delay())
             try:
-                data, addr = self.server.recvfrom(1024)
-                if not data:
-                    continue
-                
-                message = pickle.loads(data)
-                if message.get('type') == 'join':
-                    if len(self.clients) < 2:
-                        player_number = len(self.clients)
-                        self.clients[addr] = player_number
-                        self.scores[player_number] = 0
-                        
-                        if player_number == 0:
-                            self.current_turn = 0
-                        
-                        init_data = {
-                            'type': 'init',
-                            'board': self.grid.get_board(),
-                            'player_number': player_number,
-                            'current_turn': self.current_turn,
-                            'scores': self.scores,
-                            'correct_cells': self.correct_cells
-                        }
-                        self.server.sendto(pickle.dumps(init_data), addr)
-                        print(f"Player {player_number + 1} connected from {addr}")
-                    else:
-                        active_clients = {}
-                        for client_addr in self.clients:
-                            try:
-                                ping_data = {'type': 'ping'}
-                                self.server.sendto(pickle.dumps(ping_data), client_addr)
-                                active_clients[client_addr] = self.clients[client_addr]
-                            except:
-                                continue
-                        
-                        if len(active_clients) < 2:
-                            self.clients = active_clients
-                            self.reset_game_state()
-                            player_number = len(self.clients)
-                            self.clients[addr] = player_number
-                            init_data = {
-                                'type': 'init',
-                                'board': self.grid.get_board(),
-                                'player_number': player_number,
-                                'current_turn': self.current_turn,
-                                'scores': self.scores,
-                                'correct_cells': self.correct_cells
-                            }
-                            self.server.sendto(pickle.dumps(init_data), addr)
-                            print(f"Player {player_number + 1} connected from {addr}")
-                        else:
-                            print(f"Rejected connection from {addr}: Game full")
-                
-                elif message.get('type') == 'move':
-                    if addr in self.clients:
-                        player_number = self.clients[addr]
-                        if player_number == self.current_turn:
-                            self.handle_move(message, addr)
-                
-                elif message.get('type') == 'disconnect':
-                    if addr in self.clients:
-                        del self.clients[addr]
-                        if len(self.clients) == 0:
-                            self.reset_game_state()
-                        print(f"Player disconnected from {addr}")
-            
-            except Exception as e:
-                print(f"Error in server: {e}")
-
-    def handle_move(self, message, addr):
-        if addr in self.clients:
-            player_number = self.clients[addr]
-            if player_number == self.current_turn:
-                x, y, value = message['x'], message['y'], message['value']
-                if self.grid.solution[y][x] == value:
-                    self.grid.set_cell(x, y, value)
-                    self.scores[player_number] += 1
-                    self.correct_cells.add((x, y))
-                    
-                    if self.is_game_complete():
-                        game_end_data = {
-                            'type': 'game_end',
-                            'board': self.grid.get_board(),
-                            'scores': self.scores,
-                            'correct_cells': self.correct_cells
-                        }
-                        for client_addr in self.clients:
-                            self.server.sendto(pickle.dumps(game_end_data), client_addr)
-                        self.reset_game_state()
-                    else:
-                        update_data = {
-                            'type': 'update',
-                            'board': self.grid.get_board(),
-                            'current_turn': (self.current_turn + 1) % 2,
-                            'scores': self.scores,
-                            'correct_cells': self.correct_cells
-                        }
-                        for client_addr in self.clients:
-                            self.server.sendto(pickle.dumps(update_data), client_addr)
-                        self.current_turn = (self.current_turn + 1) % 2
-                else:
-                    self.scores[player_number] -= 1
-                    incorrect_update = {
-                        'type': 'incorrect',
-                        'board': self.grid.get_board(),
-                        'current_turn': (self.current_turn + 1) % 2,
-                        'scores': self.scores,
-                        'correct_cells': self.correct_cells,
-                        'incorrect_move': {
-                            'x': x,
-                            'y': y,
-                            'value': value
-                        }
-                    }
-                    self.server.sendto(pickle.dumps(incorrect_update), addr)
-                    
-                    other_update = {
-                        'type': 'update',
-                        'board': self.grid.get_board(),
-                        'current_turn': (self.current_turn + 1) % 2,
-                        'scores': self.scores,
-                        'correct_cells': self.correct_cells
-                    }
-                    for client_addr in self.clients:
-                        if client_addr != addr:
-                            self.server.sendto(pickle.dumps(other_update), client_addr)
-                    self.current_turn = (self.current_turn + 1) % 2
+                data, addr = self.server.recvfrom(MAX_DATAGRAM)
+            except (socket.timeout, BlockingIOError):
+                pass
+            else:
+                self.datagram_received(data, addr)
+            self.timers.run_due()
+
+    async def run_async(self):
+        self.loop = asyncio.get_running_loop()
+        stopped = self.loop.create_future()
+        self.loop.add_signal_handler(self.stop_signal, lambda: stopped.done() or stopped.set_result(None))
+        self.loop.add_signal_handler(signal.SIGUSR1, self.toggle_profiler)
+        await self.loop.create_datagram_endpoint(
+            lambda: SudokuProtocol(self), local_addr=(self.host, self.port))
+        print("Starting server...")
+        self.repeat(PING_INTERVAL, self.ping_clients)
+        self.repeat(EVICT_INTERVAL, self.evict_idle)
+        self.start_persistence()
+        if self.upstream is not None:
+            self.schedule_stats()
+        try:
+            await stopped
+        finally:
+            self.shutdown()
+
+    def handle_move(self, room, message, addr):
+        player_number = room.clients[addr]
+        x, y, value = message['x'], message['y'], message['value']
+        if not room.grid.contains(x, y) or value > room.grid.size or room.grid.get_cell(x, y) != 0:
+            return
+
+        correct = room.grid.can_place(x, y, value) and room.grid.is_correct(x, y, value)
+        if self.replays is not None:
+            self.replays.move(room, player_number, x, y, value, correct)
+        if correct:
+            room.grid.set_cell(x, y, value)
+            room.scores[player_number] += 1
+            room.correct_cells.add((x, y))
+
+            if room.is_game_complete():
+                game_end_data = {
+                    'type': 'game_end',
+                    'seq': room.next_seq(),
+                    'board': room.grid.get_board(),
+                    'scores': room.scores,
+                    'correct_cells': room.correct_cells
+                }
+                self.broadcast(room, game_end_data)
+                self.close_room(room, completed=True)
+                return
+            result = 'correct'
+        else:
+            room.scores[player_number] -= 1
+            result = 'incorrect'
+
+        move_delta = {
+            'type': 'delta',
+            'seq': room.next_seq(),
+            'result': result,
+            'player': player_number,
+            'x': x,
+            'y': y,
+            'value': value,
+            'current_turn': room.next_turn()
+        }
+        self.broadcast(room, move_delta)
+        if self.journal is not None:
+            self.journal.append(move_frame(room, move_delta))
+        self.start_turn(room, room.next_turn())
+
+def run_worker(index, workers, upstream, options):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if options['profile_path']:
+        options = dict(options, profile_path=f"{options['profile_path']}.{index}")
+    if options['state_dir']:
+        options = dict(options, state_dir=os.path.join(options['state_dir'], f'worker-{index}'))
+    server = SudokuServer(**options, shard=index, shards=workers, upstream=upstream)
+    server.stop_signal = signal.SIGTERM
+    server.start()
+
+
+def spawn_worker(options):
+    def spawn(index, workers, upstream):
+        context = multiprocessing.get_context('spawn')
+        process = context.Process(target=run_worker, args=(index, workers, upstream, options),
+                                  name=f'sudoku-worker-{index}')
+        process.start()
+        return process
+    return spawn
+
 
 if __name__ == "__main__":
-    server = SudokuServer()
-    server.start()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Sudoku game server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--engine', choices=['asyncio', 'sync'], default='asyncio',
+                        help='receive loop implementation (sync is the blocking recvfrom loop)')
+    parser.add_argument('--difficulty', choices=DIFFICULTIES,
+                        help='difficulty tier of generated puzzles (default: any)')
+    parser.add_argument('--clues', type=int, help='number of givens to leave in each 9x9 puzzle')
+    parser.add_argument('--bank', help='serve puzzles from a bank file built with bank.py')
+    parser.add_argument('--pool-size', type=int,
+                        help='ready puzzles kept per board size for new rooms (default: 16, or 0 for 9x9 with --bank)')
+    parser.add_argument('--pool-workers', type=int, default=1, help='background puzzle generators')
+    parser.add_argument('--pool-threads', action='store_true',
+                        help='generate puzzles in threads instead of worker processes')
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT,
+                        help='seconds of silence before a player is evicted')
+    parser.add_argument('--turn-timeout', type=float, default=TURN_TIMEOUT,
+                        help='seconds a player may stall before the turn passes')
+    parser.add_argument('--sizes', type=int, nargs='+', choices=protocol.BOARD_SIZES,
+                        default=list(protocol.BOARD_SIZES), help='board sizes clients may pick per game (default: 9 16 25)')
+    parser.add_argument('--send-seeds', action='store_true',
+                        help='start fresh games with the puzzle seed instead of the board; clients regenerate it')
+    parser.add_argument('--state-dir', help='journal moves and snapshot matches here so a restarted server '
+                                             'can resume them')
+    parser.add_argument('--replay-dir', help='record every match as a compressed event stream here '
+                                              '(read it back with replay.py)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='run N worker processes behind a dispatcher that routes each client to its match')
+    parser.add_argument('--metrics-port', type=int, help='serve Prometheus-style metrics over HTTP on this port')
+    parser.add_argument('--metrics-host', default='127.0.0.1')
+    parser.add_argument('--profile', action='store_true',
+                        help='start with cProfile enabled (SIGUSR1 toggles it at runtime)')
+    parser.add_argument('--profile-out', help='write profile stats to this file when profiling stops')
+    args = parser.parse_args()
+    try:
+        for size in args.sizes:
+            check_target(args.difficulty, args.clues if size == GRID_SIZE else None, isqrt(size))
+    except ValueError as e:
+        parser.error(str(e))
+    metrics_addr = (args.metrics_host, args.metrics_port) if args.metrics_port else None
+    if args.workers > 1:
+        options = dict(engine=args.engine, difficulty=args.difficulty, clues=args.clues,
+                       pool_size=args.pool_size, pool_workers=args.pool_workers,
+                       pool_processes=not args.pool_threads, bank_path=args.bank, profile_path=args.profile_out,
+                       state_dir=args.state_dir, idle_timeout=args.idle_timeout, turn_timeout=args.turn_timeout,
+                       send_seeds=args.send_seeds, sizes=tuple(args.sizes), replay_dir=args.replay_dir)
+        Dispatcher(args.host, args.port, args.workers, spawn_worker(options), metrics_addr).run()
+        sys.exit(0)
+    server = SudokuServer(args.host, args.port, args.engine, args.difficulty, args.clues,
+                          args.pool_size, args.pool_workers, not args.pool_threads, args.bank,
+                          metrics_addr, args.profile_out, state_dir=args.state_dir,
+                          idle_timeout=args.idle_timeout, turn_timeout=args.turn_timeout,
+                          send_seeds=args.send_seeds, sizes=tuple(args.sizes), replay_dir=args.replay_dir)
+    if args.profile:
+        server.profiler.start()
+    server.start()
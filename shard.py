@@ -0,0 +1,263 @@
+import json
+import os
+import selectors
+import signal
+import socket
+import struct
+import time
+import protocol
+from reliable import KIND, UNRELIABLE
+from metrics import Metrics, MetricsServer
+
+ROUTE = struct.Struct('!4sH')
+CONTROL = ROUTE.pack(bytes(4), 0)
+MAX_DATAGRAM = 65535 + ROUTE.size
+SUPERVISE_INTERVAL = 1.0
+ROUTE_TTL = 300.0
+SHUTDOWN_GRACE = 2.0
+
+TYPE_OFFSET = KIND.size + 1
+JOIN_OFFSET = KIND.size + protocol.HEADER.size
+JOIN_CODE = protocol.TYPE_CODES['join']
+WATCH_CODE = protocol.TYPE_CODES['watch']
+DISCONNECT_CODE = protocol.TYPE_CODES['disconnect']
+DISCONNECT = KIND.pack(UNRELIABLE) + protocol.encode({'type': 'disconnect'})
+
+
+def pack_route(addr):
+    return ROUTE.pack(socket.inet_aton(addr[0]), addr[1])
+
+
+def unpack_route(data):
+    ip, port = ROUTE.unpack_from(data)
+    return socket.inet_ntoa(ip), port
+
+
+def match_owner(match_id, workers):
+    return (match_id - 1) % workers
+
+
+def peek_message(packet):
+    if len(packet) <= TYPE_OFFSET or packet[0] != UNRELIABLE:
+        return None, None, None
+    code = packet[TYPE_OFFSET]
+    if code == JOIN_CODE and len(packet) >= JOIN_OFFSET + protocol.JOIN.size:
+        match_id, _, size = protocol.JOIN.unpack_from(packet, JOIN_OFFSET)
+        return code, match_id or None, size or protocol.BOARD_SIZES[0]
+    if code == WATCH_CODE and len(packet) >= JOIN_OFFSET + protocol.WATCH.size:
+        return code, protocol.WATCH.unpack_from(packet, JOIN_OFFSET)[0] or None, None
+    return code, None, None
+
+
+class Route:
+    __slots__ = ('worker', 'header', 'last_seen')
+
+    def __init__(self, worker, header, now):
+        self.worker = worker
+        self.header = header
+        self.last_seen = now
+
+
+class Dispatcher:
+    def __init__(self, host, port, workers, spawn, metrics_addr=None):
+        self.workers = workers
+        self.spawn = spawn
+        self.public = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.public.bind((host, port))
+        self.public.setblocking(False)
+        self.internal = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.internal.bind(('127.0.0.1', 0))
+        self.internal.setblocking(False)
+        self.upstream = self.internal.getsockname()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.public, selectors.EVENT_READ, self.pump_clients)
+        self.selector.register(self.internal, selectors.EVENT_READ, self.pump_workers)
+
+        self.processes = [None] * workers
+        self.worker_addrs = [None] * workers
+        self.worker_index = {}
+        self.worker_stats = [{} for _ in range(workers)]
+        self.routes = {}
+        self.loads = [0] * workers
+        self.pair_workers = {}
+        self.running = False
+        self.restarts = 0
+
+        self.metrics = Metrics()
+        self.forwarded = self.metrics.counter('dispatch_packets_total', 'Packets forwarded by direction', 'direction')
+        self.dropped = self.metrics.counter('dispatch_dropped_total', 'Packets dropped by reason', 'reason')
+        self.metrics.collect('dispatch_routes', 'Client addresses with a worker route', lambda: len(self.routes))
+        self.metrics.collect('dispatch_restarts_total', 'Worker restarts', lambda: self.restarts, 'counter')
+        for key, help in (('rooms', 'Active rooms'), ('players', 'Connected players'),
+                          ('received', 'Messages received'), ('moves', 'Moves received'),
+                          ('errors', 'Dropped datagrams and handler errors')):
+            self.metrics.collect(f'worker_{key}', f'{help} per worker',
+                                 lambda key=key: self.worker_totals(key), label_name='worker')
+        self.metrics_server = MetricsServer(self.metrics, *metrics_addr) if metrics_addr else None
+        print(f"Dispatcher started on {host}:{port} with {workers} workers")
+
+    def worker_totals(self, key):
+        return {index: stats.get(key, 0) for index, stats in enumerate(self.worker_stats)}
+
+    def start_worker(self, index):
+        self.processes[index] = self.spawn(index, self.workers, self.upstream)
+
+    def drop_worker(self, index):
+        addr = self.worker_addrs[index]
+        if addr is not None:
+            self.worker_index.pop(addr, None)
+            self.worker_addrs[index] = None
+        for client_addr in [addr for addr, route in self.routes.items() if route.worker == index]:
+            self.forget(client_addr)
+        for size in [size for size, worker in self.pair_workers.items() if worker == index]:
+            del self.pair_workers[size]
+        self.worker_stats[index] = {}
+
+    def supervise(self):
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                print(f"Worker {index} (pid {process.pid}) exited with code {process.exitcode}; restarting")
+                self.restarts += 1
+                self.drop_worker(index)
+                self.start_worker(index)
+
+        expired = time.monotonic() - ROUTE_TTL
+        for client_addr in [addr for addr, route in self.routes.items() if route.last_seen < expired]:
+            self.forget(client_addr)
+
+    def forget(self, client_addr):
+        route = self.routes.pop(client_addr, None)
+        if route is not None:
+            self.loads[route.worker] -= 1
+
+    def assign(self, client_addr, worker, now):
+        self.forget(client_addr)
+        route = self.routes[client_addr] = Route(worker, pack_route(client_addr), now)
+        self.loads[worker] += 1
+        return route
+
+    def place(self, client_addr, route, match_id, now, watch=False, size=None):
+        if match_id is not None:
+            worker = match_owner(match_id, self.workers)
+            if route is not None and route.worker != worker:
+                self.send_to_worker(route, DISCONNECT)
+                route = None
+            return route or self.assign(client_addr, worker, now)
+        if route is not None:
+            return route
+        if watch:
+            rooms = self.worker_totals('rooms')
+            return self.assign(client_addr, max(rooms, key=rooms.get), now)
+        worker = self.pair_workers.pop(size, None)
+        if worker is None:
+            worker = min(range(self.workers), key=lambda index: (self.worker_addrs[index] is None, self.loads[index]))
+            self.pair_workers[size] = worker
+        return self.assign(client_addr, worker, now)
+
+    def send_to_worker(self, route, packet):
+        worker_addr = self.worker_addrs[route.worker]
+        if worker_addr is None:
+            self.dropped.inc('worker_down')
+            return
+        self.internal.sendto(route.header + packet, worker_addr)
+        self.forwarded.inc('in')
+
+    def pump_clients(self):
+        now = time.monotonic()
+        while True:
+            try:
+                packet, client_addr = self.public.recvfrom(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            route = self.routes.get(client_addr)
+            code, match_id, size = peek_message(packet)
+            if code == JOIN_CODE or code == WATCH_CODE:
+                route = self.place(client_addr, route, match_id, now, code == WATCH_CODE, size)
+            if route is None:
+                self.dropped.inc('unrouted')
+                continue
+            route.last_seen = now
+            self.send_to_worker(route, packet)
+            if code == DISCONNECT_CODE:
+                self.forget(client_addr)
+
+    def pump_workers(self):
+        now = time.monotonic()
+        while True:
+            try:
+                data, worker_addr = self.internal.recvfrom(MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            if data.startswith(CONTROL):
+                try:
+                    stats = json.loads(data[ROUTE.size:])
+                except ValueError:
+                    self.dropped.inc('bad_control')
+                    continue
+                self.handle_control(stats, worker_addr)
+                continue
+            if worker_addr not in self.worker_index:
+                self.dropped.inc('unknown_worker')
+                continue
+            client_addr = unpack_route(data)
+            route = self.routes.get(client_addr)
+            if route is not None:
+                route.last_seen = now
+            self.public.sendto(data[ROUTE.size:], client_addr)
+            self.forwarded.inc('out')
+
+    def handle_control(self, stats, worker_addr):
+        index = stats.get('worker') if isinstance(stats, dict) else None
+        if type(index) is not int or not 0 <= index < self.workers:
+            self.dropped.inc('bad_control')
+            return
+        if self.processes[index] is None or stats.get('pid') != self.processes[index].pid:
+            return
+        if self.worker_addrs[index] != worker_addr:
+            self.worker_index.pop(self.worker_addrs[index], None)
+            self.worker_addrs[index] = worker_addr
+            self.worker_index[worker_addr] = index
+            print(f"Worker {index} ready on {worker_addr[0]}:{worker_addr[1]} (pid {stats['pid']})")
+        self.worker_stats[index] = stats
+
+    def stop(self, sig=None, frame=None):
+        self.running = False
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        for index in range(self.workers):
+            self.start_worker(index)
+        self.running = True
+        next_check = time.monotonic() + SUPERVISE_INTERVAL
+        while self.running:
+            for key, _ in self.selector.select(max(0.0, next_check - time.monotonic())):
+                key.data()
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + SUPERVISE_INTERVAL
+                self.supervise()
+        self.shutdown()
+
+    def shutdown(self):
+        print("\nStopping workers...")
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        deadline = time.monotonic() + SHUTDOWN_GRACE
+        while time.monotonic() < deadline and any(process.is_alive() for process in self.processes):
+            for key, _ in self.selector.select(0.05):
+                if key.data == self.pump_workers:
+                    key.data()
+        for process in self.processes:
+            if process.is_alive():
+                process.kill()
+            process.join()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        self.public.close()
+        self.internal.close()
+        totals = {key: sum(self.worker_totals(key).values()) for key in ('received', 'moves', 'errors')}
+        print(f"Dispatcher: {self.forwarded.values.get('in', 0)} packets in, "
+              f"{self.forwarded.values.get('out', 0)} out, {self.restarts} worker restarts, totals {totals}")
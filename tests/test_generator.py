@@ -0,0 +1,41 @@
+import pytest
+from generator import generate_puzzle, check_target, default_clues, rate, GenerationError, MAX_CLUES
+from grid import count_solutions
+
+
+@pytest.mark.parametrize('difficulty', ['easy', 'medium', 'hard'])
+def test_generated_puzzle_matches_tier(difficulty):
+    puzzle = generate_puzzle(difficulty, seed=7)
+    assert puzzle.difficulty == difficulty == rate(puzzle.board)
+    assert count_solutions(puzzle.board, 2) == 1
+
+
+def test_seed_reproduces_puzzle():
+    assert generate_puzzle('medium', 30, seed=3).board == generate_puzzle('medium', 30, seed=3).board
+
+
+@pytest.mark.parametrize('difficulty', ['medium', 'hard'])
+def test_unreachable_clue_count_rejected(difficulty):
+    clues = MAX_CLUES[3][difficulty] + 1
+    with pytest.raises(ValueError):
+        check_target(difficulty, clues)
+    with pytest.raises(ValueError):
+        generate_puzzle(difficulty, clues, seed=1)
+
+
+@pytest.mark.parametrize('sub_grid', [4, 5])
+@pytest.mark.parametrize('difficulty', ['medium', 'hard'])
+def test_larger_boards_have_reachable_defaults(difficulty, sub_grid):
+    limit = MAX_CLUES[sub_grid][difficulty]
+    with pytest.raises(ValueError):
+        check_target(difficulty, limit + 1, sub_grid)
+    assert default_clues(difficulty, sub_grid) <= limit
+
+
+def test_missed_tier_raises_instead_of_returning_wrong_tier():
+    for seed in range(10):
+        try:
+            puzzle = generate_puzzle('hard', MAX_CLUES[3]['hard'], seed=seed)
+        except GenerationError:
+            continue
+        assert puzzle.difficulty == 'hard'
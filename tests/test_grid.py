@@ -0,0 +1,46 @@
+import random
+from math import isqrt
+import pytest
+from grid import Grid, create_grid
+
+
+def brute_can_place(board, x, y, value):
+    size = len(board)
+    box = isqrt(size)
+    if board[y][x]:
+        return False
+    bx, by = x // box * box, y // box * box
+    return (value not in board[y] and all(board[row][x] != value for row in range(size))
+            and all(board[by + dy][bx + dx] != value for dy in range(box) for dx in range(box)))
+
+
+@pytest.mark.parametrize('sub_grid', [3, 4, 5])
+def test_masks_track_set_cell(sub_grid):
+    rng = random.Random(sub_grid)
+    solution = create_grid(sub_grid, rng)
+    size = sub_grid * sub_grid
+    board = [[value if rng.random() < 0.3 else 0 for value in row] for row in solution]
+    grid = Grid(board, solution)
+    for _ in range(size * size):
+        x, y, value = rng.randrange(size), rng.randrange(size), rng.randrange(size + 1)
+        board[y][x] = value
+        grid.set_cell(x, y, value)
+    assert grid.get_board() == board
+    assert grid.empty_count == sum(row.count(0) for row in board)
+    for y in range(size):
+        for x in range(size):
+            for value in range(1, size + 1):
+                assert grid.can_place(x, y, value) == brute_can_place(board, x, y, value)
+
+
+def test_correct_value_is_always_placeable():
+    rng = random.Random(1)
+    solution = create_grid(3, rng)
+    grid = Grid([[0] * 9 for _ in range(9)], solution)
+    cells = [(x, y) for y in range(9) for x in range(9)]
+    rng.shuffle(cells)
+    for x, y in cells:
+        value = solution[y][x]
+        assert grid.can_place(x, y, value) and grid.is_correct(x, y, value)
+        grid.set_cell(x, y, value)
+    assert grid.is_complete()
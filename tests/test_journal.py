@@ -0,0 +1,164 @@
+import os
+import shutil
+import pytest
+from generator import generate_puzzle
+from journal import (Journal, JournalError, recover, journal_path, snapshot_frames, room_frame, seat_frame,
+                     move_frame, close_frame, SNAPSHOT_FILE)
+from room import Room
+
+
+class Match:
+    def __init__(self, journal, match_id, sub_grid=3):
+        self.journal = journal
+        self.room = Room(match_id, generate_puzzle(sub_grid=sub_grid, seed=match_id))
+        journal.append(room_frame(self.room))
+        for player_number, token in enumerate((100 + match_id, 200 + match_id)):
+            self.room.occupy(player_number, token)
+            journal.append(seat_frame(self.room, player_number, token))
+        self.empty = [(x, y) for y in range(self.room.grid.size) for x in range(self.room.grid.size)
+                      if self.room.grid.get_cell(x, y) == 0]
+
+    def play(self, moves):
+        room = self.room
+        for _ in range(moves):
+            player_number = room.current_turn
+            x, y = self.empty[0]
+            value = room.puzzle.solution[y][x]
+            if room.seq % 3 == 2:
+                value = value % room.grid.size + 1
+                room.scores[player_number] -= 1
+                result = 'incorrect'
+            else:
+                self.empty.pop(0)
+                room.grid.set_cell(x, y, value)
+                room.correct_cells.add((x, y))
+                room.scores[player_number] += 1
+                result = 'correct'
+            room.current_turn = room.next_turn()
+            delta = {'seq': room.next_seq(), 'result': result, 'player': player_number, 'x': x, 'y': y,
+                     'value': value, 'current_turn': room.current_turn}
+            self.journal.append(move_frame(room, delta))
+
+
+def assert_same(recovered, room):
+    assert recovered.grid.get_board() == room.grid.get_board()
+    assert recovered.puzzle.board == room.puzzle.board
+    assert recovered.puzzle.seed == room.puzzle.seed
+    assert recovered.seq == room.seq
+    assert recovered.scores == room.scores
+    assert recovered.current_turn == room.current_turn
+    assert recovered.correct_cells == room.correct_cells
+    assert recovered.tokens == room.tokens
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = Journal(str(tmp_path), flush_interval=3600)
+    yield journal
+    if journal.running:
+        journal.close()
+
+
+def test_snapshot_plus_journal_replay(tmp_path, journal):
+    matches = [Match(journal, match_id, sub_grid) for match_id, sub_grid in ((1, 3), (2, 4), (3, 3))]
+    for match in matches:
+        match.play(5)
+    journal.flush()
+    journal.snapshot([frame for match in matches for frame in snapshot_frames(match.room)])
+    journal.flush()
+    assert journal.generation == 1
+    for match in matches:
+        match.play(4)
+    journal.append(close_frame(matches[2].room))
+    journal.close()
+
+    generation, rooms, replayed = recover(str(tmp_path))
+    assert generation == 1
+    assert replayed == 3 * 4 + 1
+    assert sorted(rooms) == [1, 2]
+    for match in matches[:2]:
+        assert_same(rooms[match.room.match_id], match.room)
+    assert sorted(os.listdir(tmp_path)) == ['journal.1', SNAPSHOT_FILE]
+
+
+def test_journal_only_replay(tmp_path, journal):
+    match = Match(journal, 7)
+    match.play(12)
+    journal.close()
+    generation, rooms, replayed = recover(str(tmp_path))
+    assert generation == 0
+    assert replayed == 3 + 12
+    assert_same(rooms[7], match.room)
+
+
+@pytest.mark.parametrize('tail', [b'\x03', b'\x03\x00\x07\x00\x00\x00\x01abc', None])
+def test_torn_tail_is_truncated(tmp_path, journal, tail):
+    match = Match(journal, 1)
+    match.play(6)
+    journal.flush()
+    valid = os.path.getsize(journal_path(str(tmp_path), 0))
+    expected = [row[:] for row in match.room.grid.get_board()]
+    scores = dict(match.room.scores)
+    match.play(1)
+    journal.close()
+    path = journal_path(str(tmp_path), 0)
+    with open(path, 'r+b') as f:
+        data = f.read()
+        f.seek(valid)
+        f.truncate()
+        if tail is None:
+            tail = bytearray(data[valid:])
+            tail[-1] ^= 0xFF
+        f.write(tail)
+
+    generation, rooms, replayed = recover(str(tmp_path))
+    assert replayed == 3 + 6
+    assert os.path.getsize(path) == valid
+    assert rooms[1].grid.get_board() == expected
+    assert rooms[1].scores == scores
+    assert recover(str(tmp_path))[2] == replayed
+
+
+def test_crash_before_snapshot_replaced(tmp_path, journal):
+    match = Match(journal, 1)
+    match.play(5)
+    journal.close()
+    open(journal_path(str(tmp_path), 1), 'wb').close()
+    with open(os.path.join(tmp_path, SNAPSHOT_FILE + '.tmp'), 'wb') as f:
+        f.write(b'partial')
+
+    generation, rooms, replayed = recover(str(tmp_path))
+    assert generation == 0
+    assert replayed == 3 + 5
+    assert_same(rooms[1], match.room)
+    assert not os.path.exists(journal_path(str(tmp_path), 1))
+
+
+def test_crash_after_snapshot_replaced(tmp_path, journal):
+    match = Match(journal, 1)
+    match.play(5)
+    journal.flush()
+    old_journal = os.path.join(tmp_path, 'old-journal')
+    shutil.copy(journal_path(str(tmp_path), 0), old_journal)
+    journal.snapshot(snapshot_frames(match.room))
+    journal.flush()
+    match.play(3)
+    journal.close()
+    os.replace(old_journal, journal_path(str(tmp_path), 0))
+
+    generation, rooms, replayed = recover(str(tmp_path))
+    assert generation == 1
+    assert replayed == 3
+    assert_same(rooms[1], match.room)
+    assert not os.path.exists(journal_path(str(tmp_path), 0))
+
+
+def test_bad_snapshot_rejected(tmp_path):
+    with open(os.path.join(tmp_path, SNAPSHOT_FILE), 'wb') as f:
+        f.write(b'SDK')
+    with pytest.raises(JournalError):
+        recover(str(tmp_path))
+    with open(os.path.join(tmp_path, SNAPSHOT_FILE), 'wb') as f:
+        f.write(b'XXXX' + bytes(10))
+    with pytest.raises(JournalError):
+        recover(str(tmp_path))
@@ -0,0 +1,36 @@
+import pytest
+import pool
+from generator import GenerationError
+from pool import PuzzlePool
+
+
+def failing_generate(*args, **kwargs):
+    raise GenerationError("no puzzle")
+
+
+def test_miss_raises_generation_error_once(monkeypatch):
+    puzzles = PuzzlePool(size=0, processes=False)
+    calls = []
+    monkeypatch.setattr(pool, 'generate_puzzle', lambda *args, **kwargs: calls.append(1) or failing_generate())
+    with pytest.raises(GenerationError):
+        puzzles.get()
+    assert calls == [1]
+    assert puzzles.misses == 1
+    puzzles.close()
+
+
+def test_miss_generates_requested_size():
+    puzzles = PuzzlePool(size=0, processes=False, sub_grids=(3, 4))
+    puzzle = puzzles.get(None, 4)
+    assert puzzle.size == 16
+    assert puzzles.stats()['misses'] == 1
+    puzzles.close()
+
+
+def test_failed_refills_are_counted(monkeypatch, capsys):
+    monkeypatch.setattr(pool, 'generate_puzzle', failing_generate)
+    puzzles = PuzzlePool(size=1, processes=False)
+    puzzles.close()
+    assert puzzles.stats()['failures'] == 1
+    assert puzzles.stats()['ready'] == {'any/9': 0}
+    assert 'no puzzle' in capsys.readouterr().out
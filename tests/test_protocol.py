@@ -0,0 +1,110 @@
+import random
+from math import isqrt
+import pytest
+import protocol
+from protocol import ProtocolError, encode, decode, HEADER, VERSION, TYPE_CODES, BOARD_SIZES
+from grid import create_grid
+
+
+def make_state(size, seed=0):
+    rng = random.Random(seed)
+    board = create_grid(isqrt(size), rng)
+    correct_cells = set()
+    for y in range(size):
+        for x in range(size):
+            if rng.random() < 0.4:
+                board[y][x] = 0
+            elif rng.random() < 0.5:
+                correct_cells.add((x, y))
+    return {'seq': 7, 'current_turn': 1, 'scores': {0: 12, 1: -3}, 'board': board, 'correct_cells': correct_cells}
+
+
+def messages(size):
+    state = make_state(size)
+    return [
+        {'type': 'join', 'match_id': 5, 'token': 2 ** 63 + 1, 'size': size},
+        {'type': 'watch', 'match_id': 9},
+        {'type': 'move', 'x': size - 1, 'y': 0, 'value': size},
+        dict(state, type='init', match_id=3, player_number=1),
+        {'type': 'start', 'match_id': 3, 'player_number': 0, 'current_turn': 1, 'seed': 2 ** 64 - 1,
+         'difficulty': 'hard', 'clues': None, 'size': size, 'seq': 0, 'scores': {0: 0, 1: 0},
+         'correct_cells': set()},
+        dict(state, type='update'),
+        dict(state, type='incorrect', incorrect_move={'x': 1, 'y': 2, 'value': 3}),
+        dict(state, type='game_end'),
+        {'type': 'ping'},
+        {'type': 'disconnect'},
+        {'type': 'delta', 'seq': 11, 'result': 'correct', 'player': 1, 'x': size - 1, 'y': size - 1,
+         'value': size, 'current_turn': 0},
+        {'type': 'sync'},
+    ]
+
+
+@pytest.mark.parametrize('size', BOARD_SIZES)
+def test_round_trip_every_type(size):
+    sent = messages(size)
+    assert {message['type'] for message in sent} == set(protocol.MESSAGE_TYPES)
+    for message in sent:
+        assert decode(encode(message)) == message
+
+
+def test_join_defaults_round_trip():
+    assert decode(encode({'type': 'join'})) == {'type': 'join'}
+    assert decode(encode({'type': 'watch'})) == {'type': 'watch'}
+
+
+def test_state_sizes():
+    for size in BOARD_SIZES:
+        data = encode(dict(make_state(size), type='update'))
+        assert len(data) == HEADER.size + protocol.STATE.size + protocol.board_bytes(size) + protocol.mask_bytes(size)
+
+
+def test_encode_unknown_type():
+    with pytest.raises(ProtocolError):
+        encode({'type': 'bogus'})
+
+
+@pytest.mark.parametrize('data', [
+    b'',
+    bytes([VERSION]),
+    bytes([VERSION - 1, TYPE_CODES['ping']]),
+    bytes([VERSION, len(protocol.MESSAGE_TYPES)]),
+    bytes([VERSION, TYPE_CODES['ping'], 0]),
+    bytes([VERSION, TYPE_CODES['move'], 1, 1]),
+    HEADER.pack(VERSION, TYPE_CODES['move']) + protocol.MOVE.pack(0, 0, 0),
+    HEADER.pack(VERSION, TYPE_CODES['move']) + protocol.MOVE.pack(25, 0, 1),
+    HEADER.pack(VERSION, TYPE_CODES['move']) + protocol.MOVE.pack(0, 0, 26),
+    HEADER.pack(VERSION, TYPE_CODES['join']) + protocol.JOIN.pack(0, 0, 10),
+    HEADER.pack(VERSION, TYPE_CODES['join']) + b'\0' * (protocol.JOIN.size + 1),
+    HEADER.pack(VERSION, TYPE_CODES['delta']) + protocol.DELTA.pack(1, 3, 0, 0, 0, 0, 0),
+    HEADER.pack(VERSION, TYPE_CODES['start']) + protocol.START.pack(1, 0, 0, 1, 3, 30, 9),
+    HEADER.pack(VERSION, TYPE_CODES['start']) + protocol.START.pack(1, 0, 0, 1, 0, 30, 12),
+    HEADER.pack(VERSION, TYPE_CODES['update']) + protocol.STATE.pack(0, 0, 0, 0, 9),
+    HEADER.pack(VERSION, TYPE_CODES['update']) + protocol.STATE.pack(0, 0, 0, 0, 4) + bytes(10),
+    HEADER.pack(VERSION, TYPE_CODES['init']) + bytes(3),
+    HEADER.pack(VERSION, TYPE_CODES['incorrect']) + bytes(2),
+])
+def test_malformed_input_raises(data):
+    with pytest.raises(ProtocolError):
+        decode(data)
+
+
+@pytest.mark.parametrize('size', BOARD_SIZES)
+def test_truncated_and_padded_states(size):
+    data = encode(dict(make_state(size), type='game_end'))
+    for cut in (1, protocol.mask_bytes(size), len(data) - HEADER.size - 1):
+        with pytest.raises(ProtocolError):
+            decode(data[:-cut])
+    with pytest.raises(ProtocolError):
+        decode(data + b'\0')
+
+
+def test_random_garbage_only_raises_protocol_error():
+    rng = random.Random(1)
+    for _ in range(5000):
+        data = bytes([VERSION, rng.randrange(len(protocol.MESSAGE_TYPES))])
+        data += rng.randbytes(rng.choice([0, 1, 3, 6, 13, 15, 50, 60, 200]))
+        try:
+            decode(data)
+        except ProtocolError:
+            pass
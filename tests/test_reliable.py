@@ -0,0 +1,86 @@
+import pytest
+from reliable import ReliableEndpoint, DATA, DATA_HEADER, WINDOW, MAX_PAYLOAD
+
+ADDR = ('127.0.0.1', 9)
+
+
+def data(seq, index=0, count=1, chunk=b'x'):
+    return DATA_HEADER.pack(DATA, seq, index, count) + chunk
+
+
+def test_fragments_reassemble_in_order():
+    sent = []
+    sender = ReliableEndpoint(lambda packet, addr: sent.append(packet))
+    receiver = ReliableEndpoint(lambda packet, addr: None)
+    message = bytes(range(256)) * (MAX_PAYLOAD // 64)
+    sender.send(message, ADDR)
+    delivered = []
+    for packet in reversed(sent):
+        delivered += receiver.receive(packet, ADDR)
+    assert delivered == [message]
+
+
+def test_bad_fragment_header_rejected():
+    receiver = ReliableEndpoint(lambda packet, addr: None)
+    for index, count in ((0, 0), (3, 3), (255, 1)):
+        with pytest.raises(ValueError):
+            receiver.receive(data(0, index, count), ADDR)
+    assert ADDR not in receiver.channels
+
+
+def test_frames_beyond_window_dropped():
+    receiver = ReliableEndpoint(lambda packet, addr: None)
+    for seq in (WINDOW, 2 ** 32 - 1, 10 ** 6):
+        assert receiver.receive(data(seq), ADDR) == []
+    channel = receiver.channels[ADDR]
+    assert not channel.received
+    assert channel.dropped == 3
+
+
+def test_unterminated_reassembly_is_bounded():
+    receiver = ReliableEndpoint(lambda packet, addr: None)
+    for seq in range(5000):
+        receiver.receive(data(seq, seq % 7, 255), ADDR)
+    channel = receiver.channels[ADDR]
+    assert len(channel.fragments) < 255
+    assert len(channel.received) == 0
+
+
+def test_sender_stays_inside_receive_window():
+    sent = []
+    sender = ReliableEndpoint(lambda packet, addr: sent.append(packet))
+    for _ in range(3 * WINDOW):
+        sender.send(b'm', ADDR)
+    assert len(sent) == WINDOW
+    receiver = ReliableEndpoint(lambda packet, addr: sender.receive(packet, ADDR))
+    for packet in sent[1:]:
+        receiver.receive(packet, ADDR)
+    assert len(sent) == WINDOW
+    receiver.receive(sent[0], ADDR)
+    assert len(sent) == 2 * WINDOW
+
+
+def test_poll_retransmits_only_due_unacked_frames():
+    now = [0.0]
+    sent = []
+    sender = ReliableEndpoint(lambda packet, addr: sent.append((packet, addr)), clock=lambda: now[0])
+    other = ('127.0.0.1', 10)
+    sender.send(b'a', ADDR)
+    sender.send(b'b', ADDR)
+    sender.send(b'c', other)
+    assert sender.next_delay() == pytest.approx(0.2)
+    receiver = ReliableEndpoint(lambda packet, addr: sender.receive(packet, ADDR))
+    receiver.receive(sent[0][0], ADDR)
+    sender.forget(other)
+    sent.clear()
+    now[0] = 0.25
+    assert sender.poll() == []
+    assert [packet[-1:] for packet, addr in sent] == [b'b']
+    assert 0 < sender.next_delay() <= 0.4
+    for _ in range(20):
+        now[0] += 10
+        failed = sender.poll()
+        if failed:
+            break
+    assert failed == [ADDR]
+    assert sender.next_delay() is None
@@ -0,0 +1,34 @@
+import socket
+import time
+import pytest
+from shard import Dispatcher, CONTROL
+
+
+class FakeProcess:
+    pid = 1234
+
+
+@pytest.fixture
+def dispatcher():
+    dispatcher = Dispatcher('127.0.0.1', 0, 2, spawn=None)
+    dispatcher.processes = [FakeProcess(), FakeProcess()]
+    yield dispatcher
+    dispatcher.public.close()
+    dispatcher.internal.close()
+
+
+def send_control(dispatcher, sender, payload):
+    sender.sendto(CONTROL + payload, dispatcher.upstream)
+    time.sleep(0.05)
+    dispatcher.pump_workers()
+
+
+def test_bad_control_packets_are_dropped(dispatcher):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sender:
+        for payload in (b'not json', b'[1]', b'{"worker": 7, "pid": 1234}', b'{"worker": -1, "pid": 1234}',
+                        b'{"worker": "0", "pid": 1234}', b'{"pid": 1234}'):
+            send_control(dispatcher, sender, payload)
+        assert dispatcher.dropped.values == {'bad_control': 6}
+        assert dispatcher.worker_addrs == [None, None]
+        send_control(dispatcher, sender, b'{"worker": 1, "pid": 1234}')
+        assert dispatcher.worker_addrs[1][1] == sender.getsockname()[1]
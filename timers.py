@@ -0,0 +1,81 @@
+import heapq
+import time
+from itertools import count
+
+
+class TimerHandle:
+    __slots__ = ('when', 'callback', 'args', 'cancelled')
+
+    def __init__(self, when, callback, args):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TimerQueue:
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.sequence = count()
+
+    def call_later(self, delay, callback, *args):
+        handle = TimerHandle(self.clock() + delay, callback, args)
+        heapq.heappush(self.heap, (handle.when, next(self.sequence), handle))
+        return handle
+
+    def next_delay(self, default=None):
+        while self.heap and self.heap[0][2].cancelled:
+            heapq.heappop(self.heap)
+        if not self.heap:
+            return default
+        return max(0.0, self.heap[0][0] - self.clock())
+
+    def run_due(self):
+        now = self.clock()
+        while self.heap and self.heap[0][0] <= now:
+            _, _, handle = heapq.heappop(self.heap)
+            if not handle.cancelled:
+                handle.callback(*handle.args)
+
+
+class Liveness:
+    def __init__(self, timeout, clock=time.monotonic):
+        self.timeout = timeout
+        self.clock = clock
+        self.last_seen = {}
+        self.scheduled = set()
+        self.heap = []
+        self.sequence = count()
+
+    def __len__(self):
+        return len(self.last_seen)
+
+    def touch(self, key):
+        now = self.clock()
+        if key not in self.scheduled:
+            self.scheduled.add(key)
+            heapq.heappush(self.heap, (now + self.timeout, next(self.sequence), key))
+        self.last_seen[key] = now
+
+    def forget(self, key):
+        self.last_seen.pop(key, None)
+
+    def expired(self):
+        now = self.clock()
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            _, _, key = heapq.heappop(self.heap)
+            last_seen = self.last_seen.get(key)
+            if last_seen is None:
+                self.scheduled.discard(key)
+            elif last_seen + self.timeout <= now:
+                del self.last_seen[key]
+                self.scheduled.discard(key)
+                expired.append(key)
+            else:
+                heapq.heappush(self.heap, (last_seen + self.timeout, next(self.sequence), key))
+        return expired